@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import math
+import time
+from collections import defaultdict, deque
+from typing import AsyncIterator, Deque, Dict, Iterable, Optional
+
+from config import TRUSTED_PROXIES
+from constants import (
+    ADMISSION_GLOBAL_CONCURRENCY,
+    ADMISSION_LANE_CONCURRENCY,
+    ADMISSION_PER_CLIENT_CONCURRENCY,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_QUEUE_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+GERMANY_LANE = "germany"
+GENERAL_LANE = "general"
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted; maps to a 429 or 503 response."""
+
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class SlotLimiter:
+    """Concurrency slots with a bounded FIFO wait queue and deadline shedding.
+
+    A freed slot is handed straight to the oldest waiter. Requests are turned
+    away without waiting when the queue is full, or when the expected wait,
+    estimated from how long slots are usually held, would overrun their
+    deadline.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int = ADMISSION_QUEUE_SIZE):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.wait_seconds = 0.0
+        self.hold_seconds = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait(self) -> float:
+        return (len(self._waiters) + 1) * self.hold_seconds / self.limit
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.expected_wait()))
+
+    def try_acquire(self) -> bool:
+        """Take a free slot without queueing; False if none is free."""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        return False
+
+    async def acquire(self, deadline: float):
+        if self.try_acquire():
+            return
+
+        remaining = deadline - time.monotonic()
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            raise AdmissionRejected(503, self.retry_after(), f"The {self.name} queue is full")
+        if self.expected_wait() > remaining:
+            self.shed += 1
+            raise AdmissionRejected(503, self.retry_after(), f"The {self.name} queue is too long")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.monotonic()
+        try:
+            await asyncio.wait({waiter}, timeout=remaining)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not waiter.done():
+            self._abandon(waiter)
+            self.shed += 1
+            raise AdmissionRejected(503, self.retry_after(), f"Timed out waiting in the {self.name} queue")
+        self.admitted += 1
+        self.wait_seconds += time.monotonic() - started
+
+    def release(self, held_seconds: Optional[float]):
+        # Exponentially weighted, so the Retry-After estimate follows load changes.
+        # ``None`` hands the slot on without a hold time, e.g. for an abandoned wait.
+        if held_seconds is not None:
+            self.hold_seconds = held_seconds if not self.hold_seconds else 0.9 * self.hold_seconds + 0.1 * held_seconds
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "hold_seconds": round(self.hold_seconds, 3),
+        }
+
+    def _abandon(self, waiter: asyncio.Future):
+        if waiter.done():
+            # The slot was handed over just as we gave up; pass it on.
+            self.release(None)
+        else:
+            waiter.cancel()
+            self._waiters.remove(waiter)
+
+
+class AdmissionController:
+    """Caps concurrent /query requests globally, per client and per lane.
+
+    Every request takes a global slot and a slot of its client for its whole
+    lifetime, including streaming. Once classified it also takes a slot in
+    the Germany (RAG) or general lane, so a burst on one path cannot starve
+    the other. Clients over their cap get a 429, overload a 503; both carry
+    a Retry-After estimate.
+    """
+
+    def __init__(
+        self,
+        global_limit: int = ADMISSION_GLOBAL_CONCURRENCY,
+        per_client_limit: int = ADMISSION_PER_CLIENT_CONCURRENCY,
+        lane_limits: Optional[Dict[str, int]] = None,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ):
+        self.per_client_limit = per_client_limit
+        self.queue_timeout = queue_timeout
+        self.global_slots = SlotLimiter("global", global_limit, queue_size)
+        self.lanes = {
+            name: SlotLimiter(name, limit, queue_size)
+            for name, limit in (lane_limits or ADMISSION_LANE_CONCURRENCY).items()
+        }
+        self.client_rejections = 0
+        self._clients: Dict[str, int] = defaultdict(int)
+
+    async def admit(self, client_id: str) -> "AdmissionTicket":
+        if self._clients[client_id] >= self.per_client_limit:
+            self.client_rejections += 1
+            raise AdmissionRejected(429, 1, "Too many concurrent requests from this client")
+        self._clients[client_id] += 1
+        try:
+            await self.global_slots.acquire(time.monotonic() + self.queue_timeout)
+        except BaseException:
+            self._release_client(client_id)
+            raise
+        return AdmissionTicket(self, client_id)
+
+    def snapshot(self) -> dict:
+        return {
+            "global": self.global_slots.snapshot(),
+            "lanes": {name: lane.snapshot() for name, lane in self.lanes.items()},
+            "active_clients": len(self._clients),
+            "client_rejections": self.client_rejections,
+        }
+
+    def _release_client(self, client_id: str):
+        self._clients[client_id] -= 1
+        if self._clients[client_id] <= 0:
+            del self._clients[client_id]
+
+
+class AdmissionTicket:
+    """The slots held by one admitted request; ``release`` is idempotent."""
+
+    def __init__(self, controller: AdmissionController, client_id: str):
+        self.controller = controller
+        self.client_id = client_id
+        self.admitted_at = time.monotonic()
+        self.lane: Optional[SlotLimiter] = None
+        self._lane_entered_at = 0.0
+        self._released = False
+
+    async def enter_lane(self, name: str):
+        if self.lane is not None or self._released:
+            return
+        lane = self.controller.lanes[name]
+        await lane.acquire(time.monotonic() + self.controller.queue_timeout)
+        self.lane = lane
+        self._lane_entered_at = time.monotonic()
+
+    def try_enter_lane(self, name: str) -> bool:
+        """Enter the lane only if it has a free slot right now."""
+        if self.lane is not None or self._released:
+            return self.lane is self.controller.lanes[name]
+        lane = self.controller.lanes[name]
+        if not lane.try_acquire():
+            return False
+        self.lane = lane
+        self._lane_entered_at = time.monotonic()
+        return True
+
+    def leave_lane(self):
+        """Give the lane slot back early, e.g. when the request switches lanes."""
+        if self.lane is None or self._released:
+            return
+        # Not a full request, so it stays out of the hold-time average.
+        self.lane.release(None)
+        self.lane = None
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        now = time.monotonic()
+        if self.lane is not None:
+            self.lane.release(now - self._lane_entered_at)
+        self.controller.global_slots.release(now - self.admitted_at)
+        self.controller._release_client(self.client_id)
+
+    async def release_after(self, answer: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Pass the answer through and release the slots once it ends or is cancelled."""
+        try:
+            async for content in answer:
+                yield content
+        finally:
+            self.release()
+
+
+def client_identifier(request, trusted_proxies: Iterable[str] = TRUSTED_PROXIES) -> str:
+    """Identify the caller by its peer address.
+
+    ``X-Forwarded-For`` is only honoured when the peer is a trusted proxy; the
+    client is then the last address in it that is not a trusted proxy, since
+    anything to the left of that was written by the client itself.
+    """
+    peer = request.client.host if request.client else "unknown"
+    trusted = set(trusted_proxies)
+    forwarded = request.headers.get("x-forwarded-for")
+    if peer not in trusted or not forwarded:
+        return peer
+    for address in reversed([a.strip() for a in forwarded.split(",") if a.strip()]):
+        if address not in trusted:
+            return address
+    return peer
@@ -0,0 +1,119 @@
+import logging
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from itertools import count
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from constants import (
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ANSWER_CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    sources: List[dict]
+    embedding: np.ndarray
+    bucket: Tuple[str, str, float]
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class SemanticAnswerCache:
+    """LRU cache of finished answers, looked up by query embedding similarity.
+
+    Entries are scoped to a (collection, model, temperature) triple and
+    expire after ``ttl`` seconds. A lookup hits when the cosine similarity
+    between the query and a cached query reaches ``similarity_threshold``.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl: float = ANSWER_CACHE_TTL,
+        similarity_threshold: float = ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._ids = count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(
+        self, embedding: Sequence[float], collection_name: str, model_name: str, temperature: float
+    ) -> Optional[CachedAnswer]:
+        self._evict_expired()
+        bucket = (collection_name, model_name, float(temperature))
+        keys = [key for key, entry in self._entries.items() if entry.bucket == bucket]
+        if not keys:
+            self.misses += 1
+            return None
+
+        matrix = np.stack([self._entries[key].embedding for key in keys])
+        scores = matrix @ _normalize(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(keys[best])
+        logger.info(f"Answer cache hit (similarity {scores[best]:.3f})")
+        return self._entries[keys[best]]
+
+    def store(
+        self,
+        embedding: Sequence[float],
+        collection_name: str,
+        model_name: str,
+        temperature: float,
+        answer: str,
+        sources: List[dict],
+    ):
+        if not answer:
+            return
+        self._entries[next(self._ids)] = CachedAnswer(
+            answer=answer,
+            sources=sources,
+            embedding=_normalize(embedding),
+            bucket=(collection_name, model_name, float(temperature)),
+        )
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_collection(self, collection_name: str):
+        stale = [key for key, entry in self._entries.items() if entry.bucket[0] == collection_name]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            logger.info(f"Dropped {len(stale)} cached answers for collection '{collection_name}'")
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+
+async def replay_answer(answer: str) -> AsyncIterator[str]:
+    """Yield a cached answer word by word, like a live completion stream."""
+    for piece in re.findall(r"\S+\s*|\s+", answer):
+        yield piece
+
+
+def _normalize(embedding: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,152 @@
+import logging
+from functools import partial
+
+import httpx
+from llama_index.core.settings import Settings
+from llama_index.embeddings.openai import OpenAIEmbedding
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from app.utils.admission import AdmissionController
+from app.utils.answer_cache import SemanticAnswerCache
+from app.utils.context_builder import context_savings
+from app.utils.embedding_cache import CachedEmbedding, EmbeddingCache
+from app.utils.history import HistoryManager
+from app.utils.local_embedding import LocalEmbedding
+from app.utils.query_rewriter import QueryRewriter
+from app.utils.retriever_registry import RetrieverRegistry
+from app.utils.single_flight import SingleFlight
+from app.utils.router import speculation_stats
+from app.utils.telemetry import register_collector, unregister_collector
+from app.utils.storage_utils import initialize_async_qdrant_client
+from config import (
+    EMBEDDING_CACHE_PATH,
+    KEEPALIVE_EXPIRY,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    QDRANT_MAX_CONNECTIONS,
+    QDRANT_MAX_KEEPALIVE_CONNECTIONS,
+)
+from constants import (
+    ANSWER_CACHE_ENABLED,
+    EMBEDDING_BACKEND,
+    LOCAL_EMBEDDING_MODEL,
+    LOCAL_EMBEDDING_ONNX,
+    LOCAL_EMBEDDING_QUANTIZE,
+    QDRANT_EMBEDDING_MODEL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def create_llm_client() -> AsyncOpenAI:
+    """Create the process-wide OpenAI client backed by one pooled HTTP client."""
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+    )
+    return AsyncOpenAI(http_client=http_client)
+
+
+def create_query_embed_model():
+    """Embed model for queries; must match the one the collection was built with."""
+    if EMBEDDING_BACKEND == "huggingface":
+        return LocalEmbedding(
+            model_name=LOCAL_EMBEDDING_MODEL,
+            quantize=LOCAL_EMBEDDING_QUANTIZE,
+            onnx=LOCAL_EMBEDDING_ONNX,
+        )
+    return OpenAIEmbedding(model=QDRANT_EMBEDDING_MODEL)
+
+
+def qdrant_pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=QDRANT_MAX_CONNECTIONS,
+        max_keepalive_connections=QDRANT_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def open_clients(app, url, api_key, environment):
+    """Attach the shared clients, retriever registry and caches to ``app.state``."""
+    app.state.llm_client = create_llm_client()
+    app.state.embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+    app.state.embed_model = CachedEmbedding(create_query_embed_model(), app.state.embedding_cache)
+    Settings.embed_model = app.state.embed_model
+    app.state.qdrant_client = initialize_async_qdrant_client(
+        url, api_key, environment, limits=qdrant_pool_limits()
+    )
+    app.state.retrievers = RetrieverRegistry(app.state.qdrant_client)
+    app.state.admission = AdmissionController()
+    app.state.single_flight = SingleFlight()
+    app.state.history = HistoryManager(app.state.llm_client)
+    app.state.query_rewriter = QueryRewriter(app.state.llm_client)
+    app.state.answer_cache = SemanticAnswerCache() if ANSWER_CACHE_ENABLED else None
+    if app.state.answer_cache is not None:
+        app.state.retrievers.add_listener(app.state.answer_cache.invalidate_collection)
+    app.state.metrics_collector = partial(collect_metrics, app)
+    register_collector(app.state.metrics_collector)
+    logger.info("Shared LLM and Qdrant clients initialized")
+
+
+async def close_clients(app):
+    """Close the shared clients, releasing their pooled connections."""
+    metrics_collector = getattr(app.state, "metrics_collector", None)
+    if metrics_collector is not None:
+        unregister_collector(metrics_collector)
+
+    llm_client = getattr(app.state, "llm_client", None)
+    if llm_client is not None:
+        await llm_client.close()
+
+    qdrant_client = getattr(app.state, "qdrant_client", None)
+    if qdrant_client is not None:
+        await qdrant_client.close()
+
+    embed_model = getattr(app.state, "embed_model", None)
+    if embed_model is not None:
+        embed_model.close()
+
+    embedding_cache = getattr(app.state, "embedding_cache", None)
+    if embedding_cache is not None:
+        embedding_cache.close()
+    logger.info("Shared LLM and Qdrant clients closed")
+
+
+def collect_metrics(app):
+    """Read the counters of the components on ``app.state`` for ``/metrics``."""
+    state = app.state
+    if state.answer_cache is not None:
+        yield "unillm_answer_cache_requests_total", "counter", {"result": "hit"}, state.answer_cache.hits
+        yield "unillm_answer_cache_requests_total", "counter", {"result": "miss"}, state.answer_cache.misses
+    yield "unillm_embedding_cache_requests_total", "counter", {"result": "hit"}, state.embedding_cache.hits
+    yield "unillm_embedding_cache_requests_total", "counter", {"result": "miss"}, state.embedding_cache.misses
+
+    rewriter = state.query_rewriter
+    yield "unillm_query_rewrites_total", "counter", {"path": "standalone"}, rewriter.standalone
+    yield "unillm_query_rewrites_total", "counter", {"path": "cache"}, rewriter.cache_hits
+    yield "unillm_query_rewrites_total", "counter", {"path": "llm"}, rewriter.rewrites
+    yield "unillm_history_summaries_total", "counter", {}, state.history.summaries_created
+
+    used = speculation_stats.launched - speculation_stats.wasted
+    yield "unillm_speculative_retrievals_total", "counter", {"outcome": "used"}, used
+    yield "unillm_speculative_retrievals_total", "counter", {"outcome": "wasted"}, speculation_stats.wasted
+    yield "unillm_context_tokens_total", "counter", {"kind": "used"}, context_savings.context_tokens
+    yield "unillm_context_tokens_total", "counter", {"kind": "saved"}, context_savings.tokens_saved
+
+    single_flight = state.single_flight
+    yield "unillm_single_flight_requests_total", "counter", {"role": "leader"}, single_flight.leaders
+    yield "unillm_single_flight_requests_total", "counter", {"role": "follower"}, single_flight.coalesced
+    yield "unillm_single_flight_in_flight", "gauge", {}, len(single_flight)
+
+    admission = state.admission
+    for limiter in (admission.global_slots, *admission.lanes.values()):
+        pool = {"pool": limiter.name}
+        yield "unillm_admission_in_flight", "gauge", pool, limiter.in_flight
+        yield "unillm_admission_queued", "gauge", pool, limiter.queued
+        yield "unillm_admission_admitted_total", "counter", pool, limiter.admitted
+        yield "unillm_admission_rejected_total", "counter", pool, limiter.rejected
+        yield "unillm_admission_shed_total", "counter", pool, limiter.shed
+    yield "unillm_admission_client_rejections_total", "counter", {}, admission.client_rejections
@@ -0,0 +1,199 @@
+import logging
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from llama_index.core.schema import NodeWithScore
+
+from constants import (
+    CENTRAL_LLM_MODEL,
+    CONTEXT_OVERLAP_THRESHOLD,
+    CONTEXT_TOKEN_BUDGET,
+    MAX_SOURCES,
+    SIMILARITY_CUTOFF,
+)
+from app.utils.sparse_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+_SEPARATOR = "\n\n"
+_SHINGLE_SIZE = 5
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model_name: str = CENTRAL_LLM_MODEL) -> Callable[[str], int]:
+    """Return a function counting the tokens of a text for ``model_name``.
+
+    Uses tiktoken's encoding for the model. If the encoding cannot be loaded
+    (tiktoken missing, or no network to fetch the BPE file on first use) it
+    falls back to roughly four characters per token.
+    """
+    try:
+        import tiktoken
+
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        logger.warning(f"Could not load a tokenizer for {model_name}, estimating tokens instead: {e}")
+        return lambda text: len(text) // 4 + 1 if text else 0
+
+
+@dataclass
+class ContextReport:
+    retrieved: int = 0
+    below_cutoff: int = 0
+    overlapping: int = 0
+    over_budget: int = 0
+    used: int = 0
+    # Tokens of the prompt without the builder: the first ``max_sources`` chunks as retrieved.
+    baseline_tokens: int = 0
+    context_tokens: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.baseline_tokens - self.context_tokens)
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "tokens_saved": self.tokens_saved}
+
+
+class ContextSavings:
+    """Running totals of the prompt tokens the context builder saved."""
+
+    def __init__(self):
+        self.queries = 0
+        self.baseline_tokens = 0
+        self.context_tokens = 0
+        self.tokens_saved = 0
+
+    def record(self, report: ContextReport):
+        self.queries += 1
+        self.baseline_tokens += report.baseline_tokens
+        self.context_tokens += report.context_tokens
+        self.tokens_saved += report.tokens_saved
+
+
+context_savings = ContextSavings()
+
+
+class ContextBuilder:
+    """Turns retrieved nodes into the context of the RAG system prompt.
+
+    Nodes scoring below ``similarity_cutoff`` are dropped, as are chunks that
+    mostly repeat a better chunk of the same URL: measured on the character
+    spans the splitter recorded when both chunks have them, on word 5-gram
+    shingles otherwise. The remaining chunks are added best first, at most
+    ``max_sources`` of them, for as long as they fit into ``token_budget``
+    tokens. Savings are measured against the prompt built without this step,
+    the first ``max_sources`` retrieved chunks, and never go below zero.
+
+    Pass ``similarity_cutoff=None`` when node scores are not similarities, e.g.
+    the rank fusion scores of the hybrid retriever, which applies the cutoff
+    itself.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        similarity_cutoff: Optional[float] = SIMILARITY_CUTOFF,
+        overlap_threshold: float = CONTEXT_OVERLAP_THRESHOLD,
+        max_sources: int = MAX_SOURCES,
+        model_name: str = CENTRAL_LLM_MODEL,
+    ):
+        self.token_budget = token_budget
+        self.similarity_cutoff = similarity_cutoff
+        self.overlap_threshold = overlap_threshold
+        self.max_sources = max_sources
+        self.count_tokens = get_token_counter(model_name)
+
+    def build(self, nodes: List[NodeWithScore]) -> dict:
+        report = ContextReport(retrieved=len(nodes))
+        token_counts = [self.count_tokens(node.node.get_content()) for node in nodes]
+        separator_tokens = self.count_tokens(_SEPARATOR)
+        baseline = token_counts[: self.max_sources]
+        report.baseline_tokens = sum(baseline) + separator_tokens * max(0, len(baseline) - 1)
+
+        ranked = sorted(zip(nodes, token_counts), key=lambda item: item[0].score or 0.0, reverse=True)
+        seen: Dict[str, List[Tuple[Optional[Tuple[int, int]], Set[tuple]]]] = {}
+        texts: List[str] = []
+        used: List[NodeWithScore] = []
+        budget = self.token_budget
+
+        for node, tokens in ranked:
+            if len(used) >= self.max_sources:
+                break
+            if self.similarity_cutoff is not None and (node.score or 0.0) < self.similarity_cutoff:
+                report.below_cutoff += 1
+                continue
+
+            url = node.node.metadata.get("url", node.node.node_id)
+            span, shingles = _char_span(node), _shingles(node.node.get_content())
+            if any(self._overlaps(span, shingles, *other) for other in seen.get(url, ())):
+                report.overlapping += 1
+                continue
+
+            cost = tokens + (separator_tokens if texts else 0)
+            if cost > budget:
+                report.over_budget += 1
+                continue
+
+            budget -= cost
+            seen.setdefault(url, []).append((span, shingles))
+            texts.append(node.node.get_content())
+            used.append(node)
+
+        report.used = len(used)
+        report.context_tokens = self.token_budget - budget
+        context_savings.record(report)
+        logger.info(
+            f"Context uses {report.used}/{report.retrieved} chunks, "
+            f"{report.context_tokens} tokens ({report.tokens_saved} saved)"
+        )
+        return {
+            "context": _SEPARATOR.join(texts),
+            "sources": self._unique_sources(used),
+            "context_report": report.to_dict(),
+        }
+
+    def _overlaps(
+        self,
+        span: Optional[Tuple[int, int]],
+        shingles: Set[tuple],
+        other_span: Optional[Tuple[int, int]],
+        other_shingles: Set[tuple],
+    ) -> bool:
+        if span is not None and other_span is not None:
+            shared = min(span[1], other_span[1]) - max(span[0], other_span[0])
+            return shared > 0 and shared / (span[1] - span[0]) >= self.overlap_threshold
+        if not shingles:
+            return False
+        return len(shingles & other_shingles) / len(shingles) >= self.overlap_threshold
+
+    def _unique_sources(self, nodes: List[NodeWithScore]) -> list:
+        seen_urls = set()
+        sources = []
+        for node in nodes:
+            url = node.node.metadata.get("url")
+            if url and url not in seen_urls:
+                seen_urls.add(url)
+                sources.append(node.node.metadata)
+        return sources[: self.max_sources]
+
+
+def _char_span(node: NodeWithScore) -> Optional[Tuple[int, int]]:
+    """Where the splitter cut the chunk out of its page, if it recorded it."""
+    start = getattr(node.node, "start_char_idx", None)
+    end = getattr(node.node, "end_char_idx", None)
+    if start is None or end is None or end <= start:
+        return None
+    return start, end
+
+
+def _shingles(text: str) -> Set[tuple]:
+    words = tokenize(text)
+    if len(words) < _SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i : i + _SHINGLE_SIZE]) for i in range(len(words) - _SHINGLE_SIZE + 1)}
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import PrivateAttr
+
+from constants import EMBEDDING_CACHE_MEMORY_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+
+def embedding_key(model_name: str, kind: str, text: str) -> str:
+    """Content hash identifying ``text`` embedded by ``model_name`` as ``kind``."""
+    return hashlib.sha256(f"{model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier embedding store: an in-memory LRU in front of a SQLite file.
+
+    Vectors are stored as raw float32 bytes. With ``path=None`` only the
+    memory tier is used.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_memory_entries: int = EMBEDDING_CACHE_MEMORY_ENTRIES):
+        self.max_memory_entries = max_memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = self._open(path) if path else None
+
+    def _open(self, path: str) -> Optional[sqlite3.Connection]:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            db.commit()
+            return db
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Embedding cache at {path} unavailable, using memory only: {e}")
+            return None
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+
+            missing = [key for key in keys if key not in found]
+            if missing and self._db is not None:
+                placeholders = ",".join("?" * len(missing))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", missing
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                    self._remember(key, found[key])
+
+        self.hits += len(found)
+        self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()],
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embed model wrapper that serves repeated texts from an ``EmbeddingCache``.
+
+    Only cache misses are forwarded to the wrapped model, in one batch.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache: EmbeddingCache, model_name: Optional[str] = None, **kwargs):
+        super().__init__(
+            model_name=model_name or embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def close(self):
+        """Release the wrapped model's resources, e.g. a local model's process pool."""
+        close = getattr(self._embed_model, "close", None)
+        if close is not None:
+            close()
+
+    def _lookup(self, kind: str, texts: List[str]):
+        keys = [embedding_key(self.model_name, kind, text) for text in texts]
+        found = self._cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        return keys, found, missing
+
+    def _merge(self, keys, found, missing, computed: List[Embedding]) -> List[Embedding]:
+        fresh = {keys[i]: vector for i, vector in zip(missing, computed)}
+        self._cache.put_many(fresh)
+        found.update(fresh)
+        return [found[key] for key in keys]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        keys, found, missing = self._lookup("query", [query])
+        computed = [self._embed_model.get_query_embedding(query)] if missing else []
+        return self._merge(keys, found, missing, computed)[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        keys, found, missing = await asyncio.to_thread(self._lookup, "query", [query])
+        computed = [await self._embed_model.aget_query_embedding(query)] if missing else []
+        return (await asyncio.to_thread(self._merge, keys, found, missing, computed))[0]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys, found, missing = self._lookup("text", texts)
+        computed = (
+            self._embed_model.get_text_embedding_batch([texts[i] for i in missing])
+            if missing else []
+        )
+        return self._merge(keys, found, missing, computed)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys, found, missing = await asyncio.to_thread(self._lookup, "text", texts)
+        computed = (
+            await self._embed_model.aget_text_embedding_batch([texts[i] for i in missing])
+            if missing else []
+        )
+        return await asyncio.to_thread(self._merge, keys, found, missing, computed)
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from app.utils.context_builder import get_token_counter
+from constants import (
+    HISTORY_CACHE_MAX_ENTRIES,
+    HISTORY_KEEP_TURNS,
+    HISTORY_SUMMARY_MAX_TOKENS,
+    HISTORY_SUMMARY_MODEL,
+    HISTORY_TOKEN_BUDGET,
+)
+
+logger = logging.getLogger(__name__)
+
+# Per-message overhead of the chat format (role and separators).
+_MESSAGE_TOKENS = 4
+
+_SUMMARY_PROMPT = """Summarize the conversation below between a student and an advisor on studying and living in Germany.
+Keep facts the student shared about themselves (nationality, degree, city, deadlines), the questions asked and the key answers.
+Write at most {max_words} words of plain text.
+
+{previous}Conversation:
+{transcript}"""
+
+
+@dataclass
+class _Summary:
+    covered: int
+    digest: str
+    text: str
+
+
+def chat_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Keep only the user and assistant messages, in the format OpenAI expects."""
+    return [
+        {"role": message["role"], "content": message["content"]}
+        for message in messages
+        if message.get("role") in ["user", "assistant"]
+    ]
+
+
+def summary_key(older: List[Dict[str, Any]], conversation_id: Optional[str] = None) -> str:
+    """Cache key of the summary of ``older``.
+
+    Without a conversation id the key is the hash of the whole summarized
+    prefix, so chats that merely open with the same message never share one.
+    """
+    if conversation_id:
+        return f"conversation:{conversation_id}"
+    return f"prefix:{_digest(older)}"
+
+
+class HistoryManager:
+    """Keeps chat history sent to the LLM within ``token_budget`` tokens.
+
+    The last ``keep_turns`` turns (a user message and the replies after it)
+    are sent verbatim. Once the whole history no longer fits the budget,
+    older turns are replaced by a summary. Summaries are cached per
+    conversation and extended with only the turns that aged out since, so a
+    long chat costs one small summarization call per turn at most. Without a
+    ``conversation_id`` only the exact same prefix reuses a summary. If the
+    summarization fails the older turns are dropped instead.
+    """
+
+    def __init__(
+        self,
+        client,
+        model_name: str = HISTORY_SUMMARY_MODEL,
+        keep_turns: int = HISTORY_KEEP_TURNS,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        summary_max_tokens: int = HISTORY_SUMMARY_MAX_TOKENS,
+        max_entries: int = HISTORY_CACHE_MAX_ENTRIES,
+    ):
+        self.client = client
+        self.model_name = model_name
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self.max_entries = max_entries
+        self.count_tokens = get_token_counter(model_name)
+        self.summaries_created = 0
+        self._summaries: "OrderedDict[str, _Summary]" = OrderedDict()
+
+    async def compact(self, messages: List[Dict[str, Any]], conversation_id: Optional[str] = None) -> List[Dict[str, str]]:
+        """Return the messages to send: maybe a summary, then the recent turns."""
+        history = chat_messages(messages)
+        if self._tokens(history) <= self.token_budget:
+            return history
+
+        turns = _split_turns(history)
+        split = max(0, len(turns) - self.keep_turns)
+        # If even the recent turns are over budget, summarize more of them;
+        # the latest turn is always kept.
+        while split < len(turns) - 1 and self._tokens(_flatten(turns[split:])) > self.token_budget:
+            split += 1
+        older, recent = _flatten(turns[:split]), _flatten(turns[split:])
+        if not older:
+            return recent
+
+        summary = await self._summarize(summary_key(older, conversation_id), older)
+        if summary is None:
+            return recent
+        summary_message = {
+            "role": "system",
+            "content": f"Summary of the earlier conversation:\n{summary}",
+        }
+        logger.info(
+            f"Compacted {len(older)} older messages ({self._tokens(older)} tokens) "
+            f"into a summary of {self._tokens([summary_message])} tokens"
+        )
+        return [summary_message, *recent]
+
+    async def _summarize(self, key: str, older: List[Dict[str, str]]) -> Optional[str]:
+        cached = self._summaries.get(key)
+        if cached is not None and cached.covered <= len(older) and cached.digest == _digest(older[:cached.covered]):
+            self._summaries.move_to_end(key)
+            if cached.covered == len(older):
+                return cached.text
+            previous, new_messages = cached.text, older[cached.covered:]
+        else:
+            previous, new_messages = None, older
+
+        try:
+            text = await self._create_summary(previous, new_messages)
+        except Exception as e:
+            logger.warning(f"History summarization failed, dropping older turns: {e}")
+            return None
+
+        self.summaries_created += 1
+        self._summaries[key] = _Summary(covered=len(older), digest=_digest(older), text=text)
+        self._summaries.move_to_end(key)
+        while len(self._summaries) > self.max_entries:
+            self._summaries.popitem(last=False)
+        return text
+
+    async def _create_summary(self, previous: Optional[str], messages: List[Dict[str, str]]) -> str:
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        prompt = _SUMMARY_PROMPT.format(
+            max_words=int(self.summary_max_tokens * 0.75),
+            previous=f"Summary so far:\n{previous}\n\n" if previous else "",
+            transcript=transcript,
+        )
+        response = await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            max_tokens=self.summary_max_tokens,
+        )
+        return response.choices[0].message.content.strip()
+
+    def _tokens(self, messages: List[Dict[str, str]]) -> int:
+        return sum(self.count_tokens(message["content"]) + _MESSAGE_TOKENS for message in messages)
+
+
+def _split_turns(messages: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+    turns: List[List[Dict[str, str]]] = []
+    for message in messages:
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _flatten(turns: List[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+    return [message for turn in turns for message in turn]
+
+
+def _digest(messages: List[Dict[str, Any]]) -> str:
+    payload = json.dumps([[m.get("role"), m.get("content")] for m in messages], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
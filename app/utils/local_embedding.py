@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Optional
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import Field, PrivateAttr
+
+from constants import LOCAL_EMBEDDING_BATCH_SIZE, LOCAL_EMBEDDING_MAX_LENGTH
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def load_local_model(model_name: str, quantize: bool = False, onnx: bool = False):
+    """Load the tokenizer and encoder for ``model_name`` once per process.
+
+    ``onnx`` exports the model to ONNX Runtime (needs ``optimum[onnxruntime]``);
+    ``quantize`` applies dynamic int8 quantization to its linear layers.
+    """
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if onnx:
+        try:
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+        except ImportError as e:
+            raise ImportError("ONNX embeddings need `pip install optimum[onnxruntime]`") from e
+        model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+        if quantize:
+            logger.warning("Quantization is only applied to PyTorch weights; ignoring it for ONNX")
+        return tokenizer, model
+
+    import torch
+
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+    if quantize:
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    logger.info(f"Loaded local embedding model {model_name}")
+    return tokenizer, model
+
+
+class LocalEmbedding(BaseEmbedding):
+    """Sentence embeddings computed in-process with a HuggingFace encoder.
+
+    Texts are sorted by token length before batching so each batch pads to a
+    similar length, and the original order is restored afterwards. With
+    ``num_processes`` set, document embeddings are spread over a process pool
+    while query embeddings stay in the current process. Workers are spawned,
+    not forked, and load their own copy of the model, since forking a process
+    that already runs torch or ONNX Runtime threads can deadlock. Call
+    ``close`` to shut the pool down.
+    """
+
+    quantize: bool = Field(default=False, description="Use dynamic int8 quantized weights.")
+    onnx: bool = Field(default=False, description="Run the encoder with ONNX Runtime.")
+    max_length: int = Field(default=LOCAL_EMBEDDING_MAX_LENGTH, description="Maximum tokens per text.")
+    embed_batch_size: int = Field(default=LOCAL_EMBEDDING_BATCH_SIZE, gt=0, description="Texts per forward pass.")
+    num_processes: int = Field(default=0, description="Worker processes for document embeddings.")
+    query_instruction: str = Field(default="", description="Prefix added to queries.")
+    text_instruction: str = Field(default="", description="Prefix added to documents.")
+
+    _pool: Optional[ProcessPoolExecutor] = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalEmbedding"
+
+    def encode(self, texts: List[str]) -> List[Embedding]:
+        import torch
+
+        tokenizer, model = load_local_model(self.model_name, self.quantize, self.onnx)
+        lengths = tokenizer(texts, truncation=True, max_length=self.max_length)["input_ids"]
+        order = sorted(range(len(texts)), key=lambda i: len(lengths[i]))
+        embeddings: List[Optional[Embedding]] = [None] * len(texts)
+
+        for start in range(0, len(order), self.embed_batch_size):
+            indices = order[start:start + self.embed_batch_size]
+            inputs = tokenizer(
+                [texts[i] for i in indices],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="pt",
+            )
+            with torch.inference_mode():
+                hidden = model(**inputs).last_hidden_state
+            mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
+            for i, vector in zip(indices, pooled.tolist()):
+                embeddings[i] = vector
+        return embeddings  # type: ignore[return-value]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self.encode([self.query_instruction + query])[0]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        texts = [self.text_instruction + text for text in texts]
+        if self.num_processes <= 1 or len(texts) <= self.embed_batch_size:
+            return self.encode(texts)
+        return self._encode_in_pool(texts)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        # Inference is CPU bound; keep it off the event loop.
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await asyncio.to_thread(self._get_text_embedding, text)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
+
+    def _encode_in_pool(self, texts: List[str]) -> List[Embedding]:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.num_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.quantize, self.onnx, self.max_length, self.embed_batch_size),
+            )
+        shard_size = max(self.embed_batch_size, -(-len(texts) // self.num_processes))
+        shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+        return [vector for shard in self._pool.map(_encode_shard, shards) for vector in shard]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+_worker_model: Optional[LocalEmbedding] = None
+
+
+def _init_worker(model_name: str, quantize: bool, onnx: bool, max_length: int, batch_size: int):
+    global _worker_model
+    import torch
+
+    # One intra-op thread per worker; the pool provides the parallelism.
+    torch.set_num_threads(1)
+    _worker_model = LocalEmbedding(
+        model_name=model_name,
+        quantize=quantize,
+        onnx=onnx,
+        max_length=max_length,
+        embed_batch_size=batch_size,
+    )
+    load_local_model(model_name, quantize, onnx)
+
+
+def _encode_shard(texts: List[str]) -> List[Embedding]:
+    assert _worker_model is not None
+    return _worker_model.encode(texts)
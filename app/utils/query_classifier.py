@@ -0,0 +1,204 @@
+import json
+import re
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from constants import CLASSIFIER_UNSURE_BAND, QUERY_CLASSIFIER_BACKEND
+
+TRAINING_SET_PATH = Path(__file__).resolve().parents[2] / "data" / "query_classifier" / "train.jsonl"
+
+_TOKEN_PATTERN = re.compile(r"[a-zäöüß0-9\-]+")
+
+# Terms that only show up when someone asks about studying, living or working
+# in Germany. Kept lower-case; matched against whole tokens or phrases.
+_GERMANY_SPECIFIC_TERMS = (
+    "blocked account", "sperrkonto", "anmeldung", "aps", "uni-assist",
+    "aufenthaltstitel", "ausländerbehörde", "immatrikulation", "studienkolleg",
+    "testdaf", "dsh", "daad", "bafög", "werkstudent", "steuer-id",
+    "rundfunkbeitrag", "anabin", "hochschule", "fachhochschule",
+)
+
+# Topics the assistant covers, but that people ask about for other countries
+# too ("US visa for New York", "scholarship in Canada"). They only decide a
+# query together with a mention of Germany.
+_TOPIC_TERMS = (
+    "visa", "residence permit", "enrolment", "enrollment", "semester",
+    "working student", "student job", "tuition", "scholarship", "blue card",
+    "health insurance", "wg", "tax id", "recognition", "recognised",
+    "job seeker", "master's", "bachelor's",
+)
+
+_GERMANY_CONTEXT = (
+    "germany", "german", "deutschland", "deutsch", "berlin", "munich",
+    "münchen", "hamburg", "cologne", "köln", "frankfurt", "stuttgart",
+    "düsseldorf", "leipzig", "dresden", "heidelberg", "aachen", "bonn",
+    "hanover", "hannover", "nuremberg", "nürnberg", "bremen", "freiburg",
+)
+
+# Other study and work destinations. A query about one of them that does not
+# mention Germany is off-topic however many topic terms it uses ("how do I
+# apply for a US student visa"). Where someone comes from does not count:
+# "student visa from the UK" is still asked by someone moving to Germany.
+_OTHER_DESTINATIONS = (
+    "usa", "u.s.", "united states", "america", "american", "uk", "u.k.",
+    "united kingdom", "britain", "british", "england", "scotland", "ireland",
+    "canada", "canadian", "australia", "australian", "new zealand",
+    "netherlands", "dutch", "france", "french", "spain", "italy", "sweden",
+    "japan", "new york", "london", "toronto", "sydney", "harvard", "oxford",
+)
+# "US" is only a country in upper case; lower-case "us" is a pronoun.
+_US_PATTERN = re.compile(r"\bU\.?S\b")
+_ORIGIN_PATTERN = re.compile(
+    r"\b(?:from|citizens? of|passport holders? of)\s+(?:the\s+)?"
+    r"(?:u\.?s\.?a?|u\.?k\.?|united states|united kingdom|new zealand|[a-z]+)\b"
+)
+
+_SMALL_TALK = re.compile(
+    r"^(hi|hello|hey|hey there|thanks?( you| a lot)?|ok(ay)?|bye|good (morning|night|evening)|who are you|what'?s your name)\W*$"
+)
+
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def load_labelled_queries(path: Path) -> List[Tuple[str, bool]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [
+            (entry["query"], bool(entry["is_germany_related"]))
+            for entry in map(json.loads, f)
+        ]
+
+
+class KeywordClassifier:
+    """Decides obvious cases from keyword lexicons and small-talk patterns.
+
+    Small talk is off-topic. A query is on-topic if it uses a term specific to
+    Germany, or a general topic term together with a mention of Germany. It is
+    off-topic if it names another destination country and not Germany.
+    Returns ``None`` otherwise so a later stage can decide.
+    """
+
+    def __init__(
+        self,
+        terms: Sequence[str] = _GERMANY_SPECIFIC_TERMS,
+        topic_terms: Sequence[str] = _TOPIC_TERMS,
+        context_terms: Sequence[str] = _GERMANY_CONTEXT,
+        other_destinations: Sequence[str] = _OTHER_DESTINATIONS,
+    ):
+        self._terms = _Lexicon(terms)
+        self._topics = _Lexicon(topic_terms)
+        self._context = _Lexicon(context_terms)
+        self._elsewhere = _Lexicon(other_destinations)
+
+    def predict(self, query: str) -> Optional[bool]:
+        text = query.strip().lower()
+        if _SMALL_TALK.match(text):
+            return False
+
+        tokens = set(_tokenize(text))
+        if self._terms.matches(text, tokens):
+            return True
+        if self._context.matches(text, tokens):
+            return True if self._topics.matches(text, tokens) else None
+        if self._is_about_elsewhere(query):
+            return False
+        return None
+
+    def _is_about_elsewhere(self, query: str) -> bool:
+        destinations = _ORIGIN_PATTERN.sub(" ", _US_PATTERN.sub(" usa ", query).lower())
+        return self._elsewhere.matches(destinations, set(_tokenize(destinations)))
+
+
+class _Lexicon:
+    def __init__(self, terms: Sequence[str]):
+        self._single = {t for t in terms if _TOKEN_PATTERN.fullmatch(t)}
+        self._phrases = [t for t in terms if not _TOKEN_PATTERN.fullmatch(t)]
+
+    def matches(self, text: str, tokens: set) -> bool:
+        return bool(tokens & self._single) or any(p in text for p in self._phrases)
+
+
+class NgramClassifier:
+    """Logistic regression over hashed word and character n-grams.
+
+    Trains in a few milliseconds on the labelled queries and runs on CPU
+    without any network call. Predictions whose probability falls inside
+    ``unsure_band`` are returned as ``None``.
+    """
+
+    def __init__(self, n_features: int = 2 ** 14, unsure_band: Tuple[float, float] = CLASSIFIER_UNSURE_BAND):
+        self.n_features = n_features
+        self.unsure_band = unsure_band
+        self.weights = np.zeros(n_features, dtype=np.float32)
+        self.bias = 0.0
+
+    def _features(self, query: str) -> np.ndarray:
+        vector = np.zeros(self.n_features, dtype=np.float32)
+        tokens = _tokenize(query)
+        grams = tokens + [" ".join(pair) for pair in zip(tokens, tokens[1:])]
+        for token in tokens:
+            padded = f"<{token}>"
+            grams.extend(padded[i:i + 4] for i in range(max(len(padded) - 3, 1)))
+        for gram in grams:
+            vector[zlib.crc32(gram.encode("utf-8")) % self.n_features] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def fit(self, examples: Sequence[Tuple[str, bool]], epochs: int = 300, learning_rate: float = 2.0, l2: float = 1e-4) -> "NgramClassifier":
+        features = np.stack([self._features(query) for query, _ in examples])
+        labels = np.array([float(label) for _, label in examples], dtype=np.float32)
+        for _ in range(epochs):
+            probabilities = 1.0 / (1.0 + np.exp(-(features @ self.weights + self.bias)))
+            error = probabilities - labels
+            self.weights -= learning_rate * (features.T @ error / len(labels) + l2 * self.weights)
+            self.bias -= learning_rate * float(error.mean())
+        return self
+
+    def probability(self, query: str) -> float:
+        score = float(self._features(query) @ self.weights + self.bias)
+        return 1.0 / (1.0 + np.exp(-score))
+
+    def predict(self, query: str) -> Optional[bool]:
+        probability = self.probability(query)
+        low, high = self.unsure_band
+        if low < probability < high:
+            return None
+        return bool(probability >= high)
+
+
+class CascadeClassifier:
+    """Runs the stages in order and returns the first confident decision."""
+
+    def __init__(self, stages: Sequence):
+        self.stages = list(stages)
+
+    def predict(self, query: str) -> Optional[bool]:
+        for stage in self.stages:
+            decision = stage.predict(query)
+            if decision is not None:
+                return decision
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_query_classifier(backend: str = QUERY_CLASSIFIER_BACKEND):
+    """Build the local classifier for ``backend`` once per process.
+
+    ``"llm"`` returns ``None``: every query is classified by the LLM prompt.
+    """
+    if backend == "llm":
+        return None
+    if backend == "keyword":
+        return KeywordClassifier()
+
+    ngram = NgramClassifier().fit(load_labelled_queries(TRAINING_SET_PATH))
+    if backend == "ngram":
+        return ngram
+    if backend == "cascade":
+        return CascadeClassifier([KeywordClassifier(), ngram])
+    raise ValueError(f"Unknown query classifier backend: {backend}")
@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+from app.utils.history import chat_messages
+from constants import (
+    QUERY_REWRITE_CACHE_MAX_ENTRIES,
+    QUERY_REWRITE_HISTORY_TURNS,
+    QUERY_REWRITE_MODEL,
+)
+
+logger = logging.getLogger(__name__)
+
+# A pronoun opening the question, after at most a few question words, points
+# back into the conversation ("how much does it cost?", "is that free?").
+# The same words later in a sentence usually do not ("can I bring my family
+# with me and how do I register them?"), and "is it possible to ..." or
+# "how long does it take to ..." have no referent at all. English and German.
+_LEADING_REFERENCE_PATTERN = re.compile(
+    r"^\s*(?:(?:what|how|when|where|which|who|why|is|are|was|were|does|do|did|can|could|should|would|will|"
+    r"much|many|long|often|of|wie|was|wann|wo|ist|sind|kann|muss|viel|lange|kostet|kosten|dauert|braucht)\s+){0,3}"
+    r"(?:it(?!\b.*\bto\s+[a-z])|its|that|this|these|those|they|them|their|same|es|das(?!\s+(?-i:[A-ZÄÖÜ]))|dies|diese|dieser|dafuer|dafür|davon|dazu)\b"
+    r"(?!\s+(?:is\s+|ist\s+)?(?:possible|necessary|mandatory|required|allowed|true|worth|enough|möglich|moeglich|"
+    r"notwendig|nötig|erlaubt|pflicht)\b)",
+    re.IGNORECASE,
+)
+# Elliptical starts that only make sense as a continuation ("and in Munich?").
+_FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(and|also|but|so|then|what about|how about|and what|or|else|"
+    r"und|auch|aber|dann|was ist mit|und wie)\b",
+    re.IGNORECASE,
+)
+_MIN_STANDALONE_WORDS = 4
+
+_REWRITE_PROMPT = """Rewrite the last user message as a standalone search query for a knowledge base about studying and living in Germany.
+Resolve pronouns and references using the conversation. Keep the user's language. Do not answer the question.
+Respond with only the rewritten query.
+
+Conversation:
+{transcript}
+
+Last user message: {query}
+
+Standalone query:"""
+
+
+def is_standalone(query: str) -> bool:
+    """Cheap check whether a message can be retrieved on without its history."""
+    if len(query.split()) < _MIN_STANDALONE_WORDS:
+        return False
+    if _FOLLOW_UP_PATTERN.search(query):
+        return False
+    return not _LEADING_REFERENCE_PATTERN.search(query)
+
+
+class QueryRewriter:
+    """Condenses the latest user turn into a standalone retrieval query.
+
+    First turns and messages that pass ``is_standalone`` are used as they are.
+    Other follow-ups are rewritten by ``model_name`` from the last
+    ``history_turns`` messages. Rewrites are cached by the messages they were
+    made from, and concurrent requests for the same rewrite share one call.
+    When the rewrite fails, the message is used unchanged.
+    """
+
+    def __init__(
+        self,
+        client,
+        model_name: str = QUERY_REWRITE_MODEL,
+        history_turns: int = QUERY_REWRITE_HISTORY_TURNS,
+        max_entries: int = QUERY_REWRITE_CACHE_MAX_ENTRIES,
+    ):
+        self.client = client
+        self.model_name = model_name
+        self.history_turns = history_turns
+        self.max_entries = max_entries
+        self.standalone = 0
+        self.cache_hits = 0
+        self.rewrites = 0
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    async def rewrite(self, messages: List[Dict[str, Any]]) -> str:
+        history = chat_messages(messages)
+        if not history or history[-1]["role"] != "user":
+            return ""
+        query = history[-1]["content"]
+        context = history[:-1][-self.history_turns:]
+        if not context or is_standalone(query):
+            self.standalone += 1
+            return query
+
+        key = _cache_key(context, query)
+        if key in self._cache:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if key in self._pending:
+            self.cache_hits += 1
+            return await asyncio.shield(self._pending[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            try:
+                rewritten = await self._create_rewrite(context, query)
+            except Exception as e:
+                logger.warning(f"Query rewrite failed, using the message as is: {e}")
+                rewritten = query
+            else:
+                self.rewrites += 1
+                self._store(key, rewritten)
+                logger.info(f"Rewrote follow-up {query!r} as {rewritten!r}")
+            future.set_result(rewritten)
+            return rewritten
+        finally:
+            del self._pending[key]
+            if not future.done():
+                # Cancelled mid-rewrite; waiting requests are cancelled too.
+                future.cancel()
+
+    async def _create_rewrite(self, context: List[Dict[str, str]], query: str) -> str:
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in context)
+        response = await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": _REWRITE_PROMPT.format(transcript=transcript, query=query)}],
+            temperature=0,
+            max_tokens=100,
+        )
+        return response.choices[0].message.content.strip().strip('"') or query
+
+    def _store(self, key: str, rewritten: str):
+        self._cache[key] = rewritten
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+
+def _cache_key(context: List[Dict[str, str]], query: str) -> str:
+    payload = json.dumps([[m["role"], m["content"]] for m in context] + [query], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
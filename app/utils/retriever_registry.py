@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.indices.vector_store.base import VectorStoreIndex
+from llama_index.vector_stores.qdrant.base import QdrantVectorStore
+
+from app.utils.context_builder import ContextBuilder
+from app.utils.sparse_index import HybridRetriever, build_sparse_index
+from app.utils.telemetry import span
+from constants import (
+    HYBRID_CANDIDATES,
+    HYBRID_RETRIEVAL,
+    INGESTION_MARKER_KEY,
+    MAX_SOURCES,
+    RETRIEVER_HEALTH_CHECK_INTERVAL,
+    SIMILARITY_CUTOFF,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _RegistryEntry:
+    retriever: BaseRetriever
+    fingerprint: str
+    content_version: str = ""
+    checked_at: float = field(default_factory=time.monotonic)
+
+
+class RetrieverRegistry:
+    """Keeps one warm retriever per Qdrant collection.
+
+    Retrievers are built on first use and reused afterwards. The collection is
+    only re-checked once ``health_check_interval`` seconds have passed or after
+    a failed retrieval; if its schema changed or it was re-ingested in the
+    meantime the retriever is rebuilt. Listeners registered with
+    ``add_listener`` are called with the collection name whenever that happens.
+
+    With ``hybrid=True`` the retriever fuses dense search with a BM25 index
+    over the collection's chunks, built when the retriever is built.
+    ``context_builder`` turns the retrieved nodes into prompt context; its
+    similarity cutoff moves into the hybrid retriever, which scores by rank
+    and drops dense and keyword hits below the cutoff alike.
+    """
+
+    def __init__(
+        self,
+        client,
+        similarity_top_k: int = MAX_SOURCES,
+        health_check_interval: float = RETRIEVER_HEALTH_CHECK_INTERVAL,
+        hybrid: bool = HYBRID_RETRIEVAL,
+        similarity_cutoff: float = SIMILARITY_CUTOFF,
+    ):
+        self.client = client
+        self.similarity_top_k = similarity_top_k
+        self.health_check_interval = health_check_interval
+        self.hybrid = hybrid
+        self.similarity_cutoff = similarity_cutoff
+        self.context_builder = ContextBuilder(similarity_cutoff=None if hybrid else similarity_cutoff)
+        self._entries: Dict[str, _RegistryEntry] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._listeners: List[Callable[[str], None]] = []
+
+    def add_listener(self, listener: Callable[[str], None]):
+        self._listeners.append(listener)
+
+    async def get(self, collection_name: str) -> BaseRetriever:
+        entry = self._entries.get(collection_name)
+        if entry is not None and not self._is_due(entry):
+            return entry.retriever
+
+        lock = self._locks.setdefault(collection_name, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(collection_name)
+            if entry is None:
+                entry = await self._build(collection_name)
+            elif self._is_due(entry):
+                entry = await self._revalidate(collection_name, entry)
+            return entry.retriever
+
+    def invalidate(self, collection_name: str):
+        if self._entries.pop(collection_name, None) is not None:
+            logger.info(f"Invalidated retriever for collection '{collection_name}'")
+
+    def _is_due(self, entry: _RegistryEntry) -> bool:
+        return time.monotonic() - entry.checked_at >= self.health_check_interval
+
+    async def _revalidate(self, collection_name: str, entry: _RegistryEntry) -> _RegistryEntry:
+        fingerprint, content_version = await self._fingerprint(collection_name)
+        if (fingerprint, content_version) != (entry.fingerprint, entry.content_version):
+            logger.info(f"Collection '{collection_name}' changed, rebuilding retriever")
+            self._notify(collection_name)
+            self.invalidate(collection_name)
+            return await self._build(collection_name, (fingerprint, content_version))
+
+        entry.checked_at = time.monotonic()
+        return entry
+
+    def _notify(self, collection_name: str):
+        for listener in self._listeners:
+            try:
+                listener(collection_name)
+            except Exception as e:
+                logger.error(f"Collection change listener failed: {e}")
+
+    async def _build(self, collection_name: str, state: Optional[Tuple[str, str]] = None) -> _RegistryEntry:
+        fingerprint, content_version = state or await self._fingerprint(collection_name)
+
+        vector_store = QdrantVectorStore(
+            aclient=self.client, collection_name=collection_name, prefer_grpc=True
+        )
+        index = VectorStoreIndex.from_vector_store(vector_store)
+        if self.hybrid:
+            dense_retriever = index.as_retriever(similarity_top_k=HYBRID_CANDIDATES, filters=None)
+            with span("sparse_index_build"):
+                sparse_index = await build_sparse_index(self.client, vector_store, collection_name)
+            retriever = HybridRetriever(
+                dense_retriever,
+                sparse_index,
+                top_k=self.similarity_top_k,
+                similarity_cutoff=self.similarity_cutoff,
+            )
+        else:
+            retriever = index.as_retriever(similarity_top_k=self.similarity_top_k, filters=None)
+
+        entry = _RegistryEntry(
+            retriever=retriever, fingerprint=fingerprint, content_version=content_version
+        )
+        self._entries[collection_name] = entry
+        logger.info(f"Built retriever for collection '{collection_name}'")
+        return entry
+
+    async def _fingerprint(self, collection_name: str) -> Tuple[str, str]:
+        """Return the collection's schema and the marker left by the last ingestion."""
+        with span("get_collection"):
+            collection_info = await self.client.get_collection(collection_name)
+        metadata = collection_info.config.metadata or {}
+        return (
+            collection_info.config.params.model_dump_json(),
+            str(metadata.get(INGESTION_MARKER_KEY, "")),
+        )
@@ -1,11 +1,23 @@
+import asyncio
 import json
-from typing import Optional, List, Dict, Any
+import logging
+from typing import Optional, List, Dict, Any, AsyncIterator, Callable
 from pydantic import BaseModel, Field
 from openai import AsyncOpenAI
-from app.utils.storage_utils import query_qdrant
-from constants import CENTRAL_LLM_MODEL
+from llama_index.core.settings import Settings
+from app.utils.admission import GENERAL_LANE, GERMANY_LANE
+from app.utils.answer_cache import replay_answer
+from app.utils.history import chat_messages
+from app.utils.query_classifier import get_query_classifier
+from app.utils.single_flight import flight_key
+from app.utils.telemetry import record_usage, span
+from app.utils.storage_utils import aquery_qdrant
+from config import DEFAULT_COLLECTION_NAME
+from constants import CENTRAL_LLM_MODEL, SPECULATIVE_RETRIEVAL
 from fastapi import HTTPException
 
+logger = logging.getLogger(__name__)
+
 
 class QueryClassification(BaseModel):
     is_germany_related: bool = Field(
@@ -13,6 +25,30 @@ class QueryClassification(BaseModel):
     )
 
 
+class SpeculationStats:
+    """Counts speculative retrievals and how many were thrown away."""
+
+    def __init__(self):
+        self.launched = 0
+        self.wasted = 0
+
+    @property
+    def waste_rate(self) -> float:
+        return self.wasted / self.launched if self.launched else 0.0
+
+    def record(self, wasted: bool):
+        self.launched += 1
+        if wasted:
+            self.wasted += 1
+        logger.info(
+            f"Speculative retrieval {'wasted' if wasted else 'used'} "
+            f"({self.wasted}/{self.launched} wasted, {self.waste_rate:.1%})"
+        )
+
+
+speculation_stats = SpeculationStats()
+
+
 def get_latest_user_message(messages: List[Dict[str, Any]]) -> str:
     """Extract the latest user message from the messages array"""
     for message in reversed(messages):
@@ -21,13 +57,52 @@ def get_latest_user_message(messages: List[Dict[str, Any]]) -> str:
     return ""
 
 
+def is_first_turn(messages: List[Dict[str, Any]]) -> bool:
+    """True when the conversation holds a single user message and no replies yet."""
+    return len([m for m in messages if m.get("role") in ["user", "assistant"]]) == 1
+
+
+async def stream_content(response) -> AsyncIterator[str]:
+    """Yield the text deltas of an OpenAI completion stream.
+
+    The stream is closed when iteration stops early, so a cancelled answer
+    also releases the upstream connection. Token usage, sent in the last
+    chunk, is recorded in the metrics.
+    """
+    try:
+        async for chunk in response:
+            if getattr(chunk, "usage", None) is not None:
+                record_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await response.close()
+
+
 class CentralController:
     def __init__(
         self,
         model_name: str = CENTRAL_LLM_MODEL,
         temperature: float = 0,
+        client: Optional[AsyncOpenAI] = None,
+        classifier=None,
+        collection_name: str = DEFAULT_COLLECTION_NAME,
+        answer_cache=None,
+        history=None,
+        conversation_id: Optional[str] = None,
+        query_rewriter=None,
+        admission_ticket=None,
+        single_flight=None,
     ):
-        self.client = AsyncOpenAI()
+        self.client = client or AsyncOpenAI()
+        self.collection_name = collection_name
+        self.answer_cache = answer_cache
+        self.history = history
+        self.conversation_id = conversation_id
+        self.query_rewriter = query_rewriter
+        self.admission_ticket = admission_ticket
+        self.single_flight = single_flight
+        self.classifier = classifier if classifier is not None else get_query_classifier()
         self.model_name = model_name
         self.temperature = temperature
 
@@ -58,6 +133,18 @@ User query: {query}
 Respond with only the JSON:"""
 
     async def classify_query(self, query: str) -> QueryClassification:
+        with span("classify"):
+            return await self._classify_query(query)
+
+    async def _classify_query(self, query: str) -> QueryClassification:
+        if self.classifier is not None:
+            decision = self.classifier.predict(query)
+            if decision is not None:
+                return QueryClassification(is_germany_related=decision)
+
+        return await self.classify_query_with_llm(query)
+
+    async def classify_query_with_llm(self, query: str) -> QueryClassification:
         try:
             response = await self.client.chat.completions.create(
                 model=self.model_name,
@@ -80,24 +167,125 @@ Respond with only the JSON:"""
             print(f"Classification error: {e}")
             return QueryClassification(is_germany_related=False)
 
-    async def process_query(self, client, messages: List[Dict[str, Any]]) -> dict:
+    async def process_query(self, retrievers, messages: List[Dict[str, Any]]) -> dict:
         query = get_latest_user_message(messages)
         if not query:
             raise HTTPException(status_code=400, detail="No user message found in messages")
-            
+
+        if self.single_flight is None:
+            return await self._answer(retrievers, messages, query)
+        # Identical concurrent requests share one answer.
+        key = flight_key(messages, self.collection_name, self.model_name, self.temperature)
+        return await self.single_flight.run(key, lambda: self._answer(retrievers, messages, query))
+
+    async def _answer(self, retrievers, messages: List[Dict[str, Any]], query: str) -> dict:
+        if self.query_rewriter is not None:
+            # Follow-ups like "and how much does it cost?" are classified and
+            # retrieved on as a standalone query.
+            with span("query_rewrite"):
+                query = await self.query_rewriter.rewrite(messages) or query
+
+        query_embedding = None
+        if self.answer_cache is not None and is_first_turn(messages):
+            with span("embed_query"):
+                query_embedding = await Settings.embed_model.aget_query_embedding(query)
+            with span("answer_cache_lookup"):
+                cached = self.answer_cache.lookup(
+                    query_embedding, self.collection_name, self.model_name, self.temperature
+                )
+            if cached is not None:
+                return {"answer": replay_answer(cached.answer), "sources": cached.sources}
+
+        result = await self._route_query(retrievers, messages, query, query_embedding)
+
+        if query_embedding is not None:
+            result["answer"] = self._cache_when_complete(result, query_embedding)
+        return result
+
+    async def _route_query(self, retrievers, messages: List[Dict[str, Any]], query: str, query_embedding=None) -> dict:
+        # Speculative retrieval counts against the Germany lane, so it only
+        # starts when that lane has a free slot; otherwise classify first.
+        if SPECULATIVE_RETRIEVAL and (
+            self.admission_ticket is None or self.admission_ticket.try_enter_lane(GERMANY_LANE)
+        ):
+            return await self._process_speculatively(retrievers, messages, query, query_embedding)
+
         classification = await self.classify_query(query)
+        await self._enter_lane(classification)
 
         if classification.is_germany_related:
-            return await self._handle_germany_query(client, messages)
+            return await self._handle_germany_query(
+                retrievers, messages, query=query, query_embedding=query_embedding
+            )
 
         return await self._handle_general_query(messages)
 
-    async def _handle_germany_query(self, client, messages: List[Dict[str, Any]]) -> dict:
-        try:
-            query = get_latest_user_message(messages)
-            qdrant_response = query_qdrant(
-                client=client, collection_name="study-in-germany", query=query
+    def _cache_when_complete(self, result: dict, query_embedding) -> AsyncIterator[str]:
+        def store(answer: str):
+            self.answer_cache.store(
+                query_embedding, self.collection_name, self.model_name, self.temperature, answer, result["sources"]
             )
+
+        return _tee_answer(result["answer"], store)
+
+    async def _enter_lane(self, classification: QueryClassification):
+        if self.admission_ticket is not None:
+            lane = GERMANY_LANE if classification.is_germany_related else GENERAL_LANE
+            with span("lane_wait"):
+                await self.admission_ticket.enter_lane(lane)
+
+    async def _process_speculatively(self, retrievers, messages: List[Dict[str, Any]], query: str, query_embedding=None) -> dict:
+        """Start retrieval while the query is still being classified.
+
+        The caller holds a Germany lane slot for the retrieval. The result is
+        only used if the query turns out to be Germany related; otherwise it is
+        cancelled, counted as wasted, and the request moves to the general lane.
+        """
+        retrieval = asyncio.create_task(
+            aquery_qdrant(
+                retrievers=retrievers,
+                collection_name=self.collection_name,
+                query=query,
+                query_embedding=query_embedding,
+            )
+        )
+        retrieval.add_done_callback(_consume_task_result)
+
+        try:
+            classification = await self.classify_query(query)
+        except BaseException:
+            retrieval.cancel()
+            raise
+
+        speculation_stats.record(wasted=not classification.is_germany_related)
+        if classification.is_germany_related:
+            return await self._handle_germany_query(retrievers, messages, retrieval=retrieval)
+
+        retrieval.cancel()
+        if self.admission_ticket is not None:
+            self.admission_ticket.leave_lane()
+        await self._enter_lane(classification)
+        return await self._handle_general_query(messages)
+
+    async def _handle_germany_query(
+        self,
+        retrievers,
+        messages: List[Dict[str, Any]],
+        retrieval: Optional[asyncio.Task] = None,
+        query_embedding=None,
+        query: Optional[str] = None,
+    ) -> dict:
+        try:
+            if retrieval is not None:
+                with span("retrieval_wait"):
+                    qdrant_response = await retrieval
+            else:
+                qdrant_response = await aquery_qdrant(
+                    retrievers=retrievers,
+                    collection_name=self.collection_name,
+                    query=query or get_latest_user_message(messages),
+                    query_embedding=query_embedding,
+                )
             
             if isinstance(qdrant_response, dict) and "error" in qdrant_response:
                 raise HTTPException(
@@ -120,46 +308,61 @@ Context:
 {context}"""
 
             openai_messages = [{"role": "system", "content": system_prompt}]
-            
-            for msg in messages:
-                if msg.get("role") in ["user", "assistant"]:
-                    openai_messages.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
+            openai_messages.extend(await self._history_messages(messages))
 
-            response = await self.client.chat.completions.create(
-                model=self.model_name,
-                messages=openai_messages,
-                temperature=self.temperature,
-                stream=True
-            )
+            with span("llm_request"):
+                response = await self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=openai_messages,
+                    temperature=self.temperature,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
 
             return {
-                "answer": response,
+                "answer": stream_content(response),
                 "sources": qdrant_response.get("sources", []),
             }
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
+    async def _history_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        if self.history is None:
+            return chat_messages(messages)
+        with span("history_compaction"):
+            return await self.history.compact(messages, self.conversation_id)
+
     async def _handle_general_query(self, messages: List[Dict[str, Any]]) -> dict:
         openai_messages = [{"role": "system", "content": "You are a helpful assistant. Provide concise and direct responses."}]
-        
-        for msg in messages:
-            if msg.get("role") in ["user", "assistant"]:
-                openai_messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-
-        response = await self.client.chat.completions.create(
-            model=self.model_name,
-            messages=openai_messages,
-            temperature=self.temperature,
-            stream=True
-        )
+        openai_messages.extend(await self._history_messages(messages))
+
+        with span("llm_request"):
+            response = await self.client.chat.completions.create(
+                model=self.model_name,
+                messages=openai_messages,
+                temperature=self.temperature,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
 
         return {
-            "answer": response,
+            "answer": stream_content(response),
             "sources": []
         }
+
+
+def _consume_task_result(task: asyncio.Task):
+    # Discarded speculative tasks may fail; read the exception so asyncio does
+    # not log it as never retrieved.
+    if not task.cancelled():
+        task.exception()
+
+
+async def _tee_answer(answer: AsyncIterator[str], on_complete: Callable[[str], None]) -> AsyncIterator[str]:
+    # Passes the answer through and hands the full text to ``on_complete`` once
+    # the stream finished normally, so aborted answers are never cached.
+    parts = []
+    async for content in answer:
+        parts.append(content)
+        yield content
+    on_complete("".join(parts))
@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.utils.history import chat_messages
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold and collapse whitespace and trailing punctuation."""
+    return _WHITESPACE.sub(" ", query).strip().rstrip("?!. ").casefold()
+
+
+def flight_key(messages: List[Dict[str, Any]], collection_name: str, model_name: str, temperature: float) -> str:
+    """Requests with equal keys would produce the same answer and can share one."""
+    history = chat_messages(messages)
+    payload = json.dumps(
+        {
+            "collection": collection_name,
+            "model": model_name,
+            "temperature": temperature,
+            "query": normalize_query(history[-1]["content"]) if history else "",
+            "history": [[m["role"], m["content"]] for m in history[:-1]],
+        },
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """One upstream answer, buffered so any number of subscribers can replay it."""
+
+    def __init__(self, on_finished: Callable[[], None]):
+        self.sources: "asyncio.Future[List[dict]]" = asyncio.get_running_loop().create_future()
+        # Followers may all be gone by the time the leader fails.
+        self.sources.add_done_callback(lambda future: future.cancelled() or future.exception())
+        self.parts: List[str] = []
+        self.finished = False
+        self.error: Optional[Exception] = None
+        self.subscribers = 0
+        self._on_finished = on_finished
+        self._updated = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, answer: AsyncIterator[str]):
+        self._task = asyncio.create_task(self._drain(answer))
+
+    async def _drain(self, answer: AsyncIterator[str]):
+        try:
+            async for content in answer:
+                self.parts.append(content)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        except asyncio.CancelledError:
+            # Anyone still subscribed must not mistake the partial answer for a full one.
+            self.error = RuntimeError("The answer was cancelled before it finished")
+            raise
+        finally:
+            self.finished = True
+            self._notify()
+            self._on_finished()
+
+    def _notify(self):
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    def subscribe(self) -> AsyncIterator[str]:
+        # Counted right away, so the answer is not cancelled before a new
+        # subscriber started reading.
+        self.subscribers += 1
+        return self._replay()
+
+    async def _replay(self) -> AsyncIterator[str]:
+        index = 0
+        try:
+            while True:
+                while index < len(self.parts):
+                    yield self.parts[index]
+                    index += 1
+                if self.finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._updated.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.finished and self._task is not None:
+                # Every client went away; stop generating. The flight is
+                # dropped right away, so a request arriving before the task
+                # unwound starts a new answer instead of joining this one.
+                self._on_finished()
+                self._task.cancel()
+
+
+class SingleFlight:
+    """Shares one in-flight answer between identical concurrent requests.
+
+    The first request for a key (the leader) runs ``produce``; requests for
+    the same key arriving before its answer finished streaming wait for it
+    and then replay the same token stream from the start. The upstream
+    completion is cancelled only once all subscribers have disconnected.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._flights: Dict[str, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key: str, produce: Callable[[], Awaitable[dict]]) -> dict:
+        while key in self._flights:
+            flight = self._flights[key]
+            try:
+                sources = await asyncio.shield(flight.sources)
+            except asyncio.CancelledError:
+                if flight.sources.cancelled():
+                    # The leader was cancelled before answering; start over.
+                    continue
+                raise
+            self.coalesced += 1
+            logger.info(f"Joined an in-flight answer ({flight.subscribers} other subscribers)")
+            return {"answer": flight.subscribe(), "sources": sources}
+
+        flight = _Flight(on_finished=lambda: self._finish(key, flight))
+        self._flights[key] = flight
+        self.leaders += 1
+        try:
+            result = await produce()
+        except BaseException as e:
+            self._finish(key, flight)
+            if isinstance(e, Exception):
+                flight.sources.set_exception(e)
+            else:
+                flight.sources.cancel()
+            raise
+
+        flight.start(result["answer"])
+        flight.sources.set_result(result["sources"])
+        return {"answer": flight.subscribe(), "sources": result["sources"]}
+
+    def _finish(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
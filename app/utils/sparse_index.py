@@ -0,0 +1,139 @@
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+
+from constants import HYBRID_CANDIDATES, MAX_SOURCES, RRF_K
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_FOLDING = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or "
+    "the to what when where which who why will with you your "
+    "der die das und ist ein eine in im zu den mit von fuer auf".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case, fold umlauts and drop stop words, so "Sperrkonto" matches "sperrkonto"."""
+    tokens = _TOKEN_PATTERN.findall(text.lower().translate(_FOLDING))
+    return [token for token in tokens if token not in _STOPWORDS]
+
+
+class BM25Index:
+    """In-memory Okapi BM25 index over the text of retrieved nodes."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.nodes: List[BaseNode] = []
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def add(self, node: BaseNode):
+        terms = Counter(tokenize(node.get_content()))
+        doc_index = len(self.nodes)
+        self.nodes.append(node)
+        self._lengths.append(sum(terms.values()))
+        for term, frequency in terms.items():
+            self._postings[term].append((doc_index, frequency))
+
+    def search(self, query: str, top_k: int) -> List[Tuple[BaseNode, float]]:
+        if not self.nodes:
+            return []
+        average_length = sum(self._lengths) / len(self._lengths)
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.nodes) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_index, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_index] / average_length)
+                scores[doc_index] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.nodes[doc_index], score) for doc_index, score in ranked]
+
+
+async def build_sparse_index(client, vector_store, collection_name: str, page_size: int = 512) -> BM25Index:
+    """Scroll every point of the collection into a fresh BM25 index."""
+    index = BM25Index()
+    offset = None
+    while True:
+        points, offset = await client.scroll(
+            collection_name, limit=page_size, offset=offset, with_payload=True, with_vectors=False
+        )
+        for node in vector_store.parse_to_query_result(points).nodes:
+            index.add(node)
+        if offset is None:
+            break
+    logger.info(f"Built sparse index for '{collection_name}' with {len(index)} chunks")
+    return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[NodeWithScore]], k: int = RRF_K) -> List[NodeWithScore]:
+    """Fuse ranked lists by summing 1 / (k + rank) per node."""
+    fused: Dict[str, float] = defaultdict(float)
+    nodes: Dict[str, NodeWithScore] = {}
+    for ranking in rankings:
+        for rank, node in enumerate(ranking, start=1):
+            fused[node.node.node_id] += 1.0 / (k + rank)
+            nodes.setdefault(node.node.node_id, node)
+    ordered = sorted(fused, key=fused.get, reverse=True)
+    return [NodeWithScore(node=nodes[node_id].node, score=fused[node_id]) for node_id in ordered]
+
+
+class HybridRetriever(BaseRetriever):
+    """Dense retrieval fused with BM25 keyword retrieval via reciprocal rank fusion.
+
+    Both retrievers return ``candidates`` results and the best ``top_k`` of the
+    fused ranking are kept, never more than ``MAX_SOURCES``. Scores of the returned nodes are RRF scores, so a
+    ``similarity_cutoff`` is applied before fusion: to the dense candidates by
+    their score, and to keyword hits by the dense similarity of the same chunk.
+    A keyword hit outside the dense candidates is dropped as well, since its
+    similarity is unknown. One shared keyword does not make a chunk relevant.
+    """
+
+    def __init__(
+        self,
+        dense_retriever: BaseRetriever,
+        sparse_index: BM25Index,
+        top_k: int = MAX_SOURCES,
+        candidates: int = HYBRID_CANDIDATES,
+        similarity_cutoff: Optional[float] = None,
+    ):
+        super().__init__()
+        self.dense_retriever = dense_retriever
+        self.sparse_index = sparse_index
+        self.top_k = min(top_k, MAX_SOURCES)
+        self.candidates = candidates
+        self.similarity_cutoff = similarity_cutoff
+
+    def _fuse(self, dense: List[NodeWithScore], query: str) -> List[NodeWithScore]:
+        sparse = self._sparse(query)
+        if self.similarity_cutoff is not None:
+            dense = [node for node in dense if (node.score or 0.0) >= self.similarity_cutoff]
+            relevant = {node.node.node_id for node in dense}
+            sparse = [node for node in sparse if node.node.node_id in relevant]
+        return reciprocal_rank_fusion([dense, sparse])[: self.top_k]
+
+    def _sparse(self, query: str) -> List[NodeWithScore]:
+        return [
+            NodeWithScore(node=node, score=score)
+            for node, score in self.sparse_index.search(query, self.candidates)
+        ]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self._fuse(self.dense_retriever.retrieve(query_bundle), query_bundle.query_str)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self._fuse(await self.dense_retriever.aretrieve(query_bundle), query_bundle.query_str)
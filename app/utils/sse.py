@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, List, Optional
+
+from constants import (
+    SSE_COALESCE_INTERVAL,
+    SSE_DISCONNECT_POLL_INTERVAL,
+    SSE_HEARTBEAT_INTERVAL,
+    SSE_MAX_CHUNK_CHARS,
+    SSE_QUEUE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+HEARTBEAT = ": heartbeat\n\n"
+
+
+def format_event(event: str, data: Any) -> str:
+    """Frame one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def sse_events(
+    answer: AsyncIterator[str],
+    sources: List[dict],
+    request=None,
+    heartbeat_interval: float = SSE_HEARTBEAT_INTERVAL,
+    coalesce_interval: float = SSE_COALESCE_INTERVAL,
+    max_chunk_chars: int = SSE_MAX_CHUNK_CHARS,
+    poll_interval: float = SSE_DISCONNECT_POLL_INTERVAL,
+    queue_size: int = SSE_QUEUE_SIZE,
+) -> AsyncIterator[str]:
+    """Stream an answer as ``sources``, ``token``, ``done`` and ``error`` events.
+
+    The answer is read by a separate task into a bounded queue, so a slow
+    client eventually stops reading from upstream too. Tokens arriving within
+    ``coalesce_interval`` of the last write are sent as one event, and a
+    heartbeat comment is sent when nothing was written for
+    ``heartbeat_interval`` seconds. If ``request`` reports the client
+    disconnected, the upstream completion is cancelled right away.
+    """
+    loop = asyncio.get_running_loop()
+    tokens: asyncio.Queue = asyncio.Queue(queue_size)
+    pump = asyncio.create_task(_pump(answer, tokens))
+    getter: Optional[asyncio.Future] = None
+    buffer: List[str] = []
+    buffered = 0
+    last_write = last_poll = loop.time()
+    # The first token is sent as soon as it arrives.
+    last_flush = last_write - coalesce_interval
+
+    try:
+        yield format_event("sources", sources)
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(tokens.get())
+            timeout = poll_interval
+            if buffer:
+                timeout = min(timeout, max(0.0, last_flush + coalesce_interval - loop.time()))
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+
+            now = loop.time()
+            if request is not None and now - last_poll >= poll_interval:
+                last_poll = now
+                if await request.is_disconnected():
+                    logger.info("Client disconnected, cancelling the answer stream")
+                    return
+
+            item = None
+            if done:
+                item = getter.result()
+                getter = None
+                if isinstance(item, str):
+                    buffer.append(item)
+                    buffered += len(item)
+
+            finished = item is _END or isinstance(item, Exception)
+            if buffer and (finished or buffered >= max_chunk_chars or now - last_flush >= coalesce_interval):
+                yield format_event("token", {"text": "".join(buffer)})
+                buffer, buffered = [], 0
+                last_flush = last_write = now
+
+            if item is _END:
+                yield format_event("done", {})
+                return
+            if isinstance(item, Exception):
+                logger.error(f"Streaming error: {item}")
+                yield format_event("error", {"error": str(item)})
+                return
+            if now - last_write >= heartbeat_interval:
+                yield HEARTBEAT
+                last_write = now
+    finally:
+        # Also runs when the server closes the generator after a failed write.
+        pump.cancel()
+        if getter is not None:
+            getter.cancel()
+
+
+async def _pump(answer: AsyncIterator[str], tokens: asyncio.Queue):
+    try:
+        async for content in answer:
+            await tokens.put(content)
+    except Exception as e:
+        await tokens.put(e)
+    else:
+        await tokens.put(_END)
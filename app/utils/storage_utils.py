@@ -1,15 +1,22 @@
 import logging
+from datetime import datetime, timezone
 from llama_index.core.indices.vector_store.base import VectorStoreIndex
+from llama_index.core.schema import QueryBundle
+from llama_index.core.settings import Settings
 from llama_index.vector_stores.qdrant.base import QdrantVectorStore
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from fastapi import HTTPException
 
-from constants import MAX_SOURCES
+from app.utils.context_builder import ContextBuilder
+from app.utils.telemetry import span
+from constants import INGESTION_MARKER_KEY, MAX_SOURCES
 
 logger = logging.getLogger(__name__)
 
 def query_qdrant(client, collection_name, query):
-    if not _test_qdrant_connection(client):
+    with span("qdrant_connection_test"):
+        connected = _test_qdrant_connection(client)
+    if not connected:
         raise HTTPException(
             status_code=503,
             detail="Database connection failed. Please ensure Qdrant server is running."
@@ -19,11 +26,13 @@ def query_qdrant(client, collection_name, query):
         vector_store = QdrantVectorStore(
             client=client, collection_name=collection_name, prefer_grpc=True
         )
-        collection_info = client.get_collection(collection_name)
+        with span("get_collection"):
+            collection_info = client.get_collection(collection_name)
         logger.info(f"Collection info: {collection_info}")
 
         index = VectorStoreIndex.from_vector_store(vector_store)
-        nodes = _retrieve_nodes(index, query)
+        with span("vector_search"):
+            nodes = _retrieve_nodes(index, query)
 
         if not nodes:
             logger.warning("No source nodes found")
@@ -39,6 +48,47 @@ def query_qdrant(client, collection_name, query):
         )
 
 
+async def aquery_qdrant(retrievers, collection_name, query, query_embedding=None):
+    """Async counterpart of ``query_qdrant`` for use inside request handlers.
+
+    ``retrievers`` is the shared ``RetrieverRegistry``; the retriever for the
+    collection is reused across queries and only rebuilt when it fails, and
+    its ``context_builder`` packs the nodes into the prompt context.
+    Pass ``query_embedding`` when the query was already embedded.
+    """
+    try:
+        with span("retriever_get"):
+            retriever = await retrievers.get(collection_name)
+    except Exception as e:
+        logger.error(f"Failed to connect to Qdrant: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Database connection failed. Please ensure Qdrant server is running."
+        )
+
+    try:
+        if query_embedding is None:
+            with span("embed_query"):
+                query_embedding = await Settings.embed_model.aget_query_embedding(query)
+        with span("vector_search"):
+            nodes = await retriever.aretrieve(QueryBundle(query_str=query, embedding=query_embedding))
+
+        if not nodes:
+            logger.warning("No source nodes found")
+            return {"context": "", "sources": []}
+
+        with span("context_build"):
+            return retrievers.context_builder.build(nodes)
+
+    except Exception as e:
+        retrievers.invalidate(collection_name)
+        logger.error(f"Error during query processing: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Query processing failed: {str(e)}"
+        )
+
+
 def _test_qdrant_connection(client) -> bool:
     try:
         client.get_collections()
@@ -54,26 +104,26 @@ def _retrieve_nodes(index: VectorStoreIndex, query: str) -> list:
 
 
 def _process_retrieved_nodes(nodes: list) -> dict:
-    context_text = "\n\n".join([node.node.text for node in nodes])
-    unique_sources = _filter_unique_sources(nodes)
-    return {"context": context_text, "sources": unique_sources}
+    return ContextBuilder().build(nodes)
 
 
-def _filter_unique_sources(nodes: list) -> list:
-    seen_urls = set()
-    unique_sources = []
-    for node in sorted(
-        nodes, key=lambda x: x.score if hasattr(x, "score") else 0, reverse=True
-    ):
-        url = node.node.metadata.get("url")
-        if url and url not in seen_urls:
-            seen_urls.add(url)
-            unique_sources.append(node.node.metadata)
-    return unique_sources
+def initialize_qdrant_client(url, api_key, environment, **kwargs):
+    try:
+        return QdrantClient(url="http://localhost:6333", **kwargs) if environment == "dev" else QdrantClient(url, api_key=api_key, **kwargs)
+    except Exception as e:
+        raise RuntimeError(f"Error initializing Qdrant client: {str(e)}")
 
 
-def initialize_qdrant_client(url, api_key, environment):
+def initialize_async_qdrant_client(url, api_key, environment, **kwargs):
     try:
-        return QdrantClient(url="http://localhost:6333") if environment == "dev" else QdrantClient(url, api_key=api_key)
+        return AsyncQdrantClient(url="http://localhost:6333", **kwargs) if environment == "dev" else AsyncQdrantClient(url, api_key=api_key, **kwargs)
     except Exception as e:
         raise RuntimeError(f"Error initializing Qdrant client: {str(e)}")
+
+
+def mark_collection_ingested(client, collection_name):
+    """Record the ingestion time on the collection so running APIs drop stale caches."""
+    client.update_collection(
+        collection_name=collection_name,
+        metadata={INGESTION_MARKER_KEY: datetime.now(timezone.utc).isoformat()},
+    )
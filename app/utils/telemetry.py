@@ -0,0 +1,158 @@
+"""Per-stage timing spans and counters, rendered in the Prometheus text format.
+
+``span("classify")`` times a block into the ``unillm_stage_seconds``
+histogram. When OpenTelemetry is installed and ``OTEL_ENABLED`` is set, each
+span is also exported as a trace span. Metrics owned by other components
+(cache hit counters, admission slots) are read at scrape time through
+``register_collector`` instead of being updated on the hot path.
+"""
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import OTEL_ENABLED
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, str, Dict[str, str], float]
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            # One count per bucket, then +Inf, then the sum.
+            series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, float("inf")), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', le),))} {cumulative:g}")
+            lines.append(f"{self.name}_sum{_labels(key)} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{_labels(key)} {cumulative:g}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_labels(key)} {value:g}" for key, value in sorted(self._values.items()))
+        return lines
+
+
+stage_seconds = Histogram("unillm_stage_seconds", "Duration of each stage of a query.")
+llm_tokens = Counter("unillm_llm_tokens_total", "Tokens reported by the LLM API, by kind.")
+
+_collectors: List[Callable[[], Iterable[Sample]]] = []
+_tracer = None
+if OTEL_ENABLED:
+    try:
+        from opentelemetry import trace
+
+        _tracer = trace.get_tracer("unillm")
+    except ImportError:
+        logger.warning("OTEL_ENABLED is set but opentelemetry is not installed; tracing is off")
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block as ``stage``; also an OpenTelemetry span when tracing is on."""
+    started = time.perf_counter()
+    if _tracer is None:
+        try:
+            yield
+        finally:
+            stage_seconds.observe(time.perf_counter() - started, stage=stage)
+        return
+    with _tracer.start_as_current_span(stage):
+        try:
+            yield
+        finally:
+            stage_seconds.observe(time.perf_counter() - started, stage=stage)
+
+
+async def observe_stream(answer: AsyncIterator[str], started: float) -> AsyncIterator[str]:
+    """Record time to first token and total time of an answer stream.
+
+    ``started`` is the ``time.perf_counter()`` value when the request arrived.
+    """
+    first = True
+    try:
+        async for content in answer:
+            if first:
+                stage_seconds.observe(time.perf_counter() - started, stage="time_to_first_token")
+                first = False
+            yield content
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage="total")
+
+
+def record_usage(usage):
+    """Count the prompt and completion tokens of an OpenAI ``usage`` object."""
+    if usage is None:
+        return
+    llm_tokens.inc(usage.prompt_tokens, kind="prompt")
+    llm_tokens.inc(usage.completion_tokens, kind="completion")
+
+
+def register_collector(collector: Callable[[], Iterable[Sample]]):
+    """Add a callback returning ``(name, type, labels, value)`` samples at scrape time."""
+    _collectors.append(collector)
+
+
+def unregister_collector(collector: Callable[[], Iterable[Sample]]):
+    if collector in _collectors:
+        _collectors.remove(collector)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in (stage_seconds, llm_tokens):
+        lines.extend(metric.render())
+
+    described = set()
+    for collector in _collectors:
+        try:
+            samples = list(collector())
+        except Exception as e:
+            logger.error(f"Metrics collector failed: {e}")
+            continue
+        for name, kind, labels, value in samples:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(key: Optional[Labels]) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
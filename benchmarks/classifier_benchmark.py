@@ -0,0 +1,94 @@
+"""Compare the local query classifiers against the LLM classifier prompt.
+
+Usage:
+    python benchmarks/classifier_benchmark.py [--llm] [--output results.json]
+
+Without ``--llm`` only the local backends are evaluated, so no API key is
+needed. Undecided local predictions are counted separately: in production
+they fall back to the LLM.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import rootutils
+
+rootutils.setup_root(__file__, indicator=".project_root", pythonpath=True)
+
+from app.utils.query_classifier import TRAINING_SET_PATH, get_query_classifier, load_labelled_queries  # noqa: E402
+
+EVAL_SET_PATH = TRAINING_SET_PATH.parent / "eval.jsonl"
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def _summarize(name, examples, predictions, latencies):
+    decided = [(label, pred) for (_, label), pred in zip(examples, predictions) if pred is not None]
+    correct = sum(label == pred for label, pred in decided)
+    return {
+        "backend": name,
+        "examples": len(examples),
+        "decided": len(decided),
+        "undecided": len(examples) - len(decided),
+        "accuracy_on_decided": correct / len(decided) if decided else 0.0,
+        "errors": len(decided) - correct,
+        "latency_ms_p50": _percentile(latencies, 0.50) * 1000,
+        "latency_ms_p95": _percentile(latencies, 0.95) * 1000,
+        "latency_ms_mean": statistics.mean(latencies) * 1000,
+    }
+
+
+def benchmark_local(backend, examples):
+    classifier = get_query_classifier(backend)
+    predictions, latencies = [], []
+    for query, _ in examples:
+        start = time.perf_counter()
+        predictions.append(classifier.predict(query))
+        latencies.append(time.perf_counter() - start)
+    return _summarize(backend, examples, predictions, latencies)
+
+
+async def benchmark_llm(examples):
+    from app.utils.router import CentralController
+
+    controller = CentralController()
+    predictions, latencies = [], []
+    for query, _ in examples:
+        start = time.perf_counter()
+        classification = await controller.classify_query_with_llm(query)
+        latencies.append(time.perf_counter() - start)
+        predictions.append(classification.is_germany_related)
+    await controller.client.close()
+    return _summarize("llm", examples, predictions, latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--llm", action="store_true", help="Also evaluate the LLM prompt (needs OPENAI_API_KEY)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    examples = load_labelled_queries(EVAL_SET_PATH)
+    results = [benchmark_local(backend, examples) for backend in ("keyword", "ngram", "cascade")]
+    if args.llm:
+        results.append(asyncio.run(benchmark_llm(examples)))
+
+    for result in results:
+        print(
+            f"{result['backend']:>8}: decided {result['decided']}/{result['examples']}, "
+            f"accuracy {result['accuracy_on_decided']:.1%}, "
+            f"p50 {result['latency_ms_p50']:.2f} ms, p95 {result['latency_ms_p95']:.2f} ms"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Throughput benchmark of the PII cleaning stage on a synthetic corpus.
+
+Usage:
+    python benchmarks/cleaning_benchmark.py [--records 2000] [--workers 4] [--output results.json]
+
+Compares the notebook's per-document cleaning (regexes compiled on every call,
+the full spaCy pipeline run twice per text) with ``PIICleaner`` in one
+process, on a process pool, and on a rerun served from its cache. Needs spaCy
+and the ``en_core_web_sm`` model.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from typing import List
+
+import rootutils
+
+rootutils.setup_root(__file__, indicator=".project_root", pythonpath=True)
+
+from constants import CLEANING_BATCH_SIZE, CLEANING_SPACY_MODEL  # noqa: E402
+from scripts.pii_cleaning import PIICleaner  # noqa: E402
+
+NAMES = ["Anna Schmidt", "Lukas Weber", "Maria Garcia", "Ahmed Khan", "Julia Fischer"]
+CITIES = ["Berlin", "Munich", "Hamburg", "Cologne", "Leipzig"]
+SENTENCES = [
+    "To apply for a student visa you need proof of financial resources.",
+    "Contact {name} at {email} or call {phone} for an appointment.",
+    "The international office is located at {number} Main Street, {city}.",
+    "Most universities in {city} charge no tuition fees for bachelor programmes.",
+    "A blocked account is the most common way to prove your finances.",
+    "{name} from the student services answers questions about housing.",
+]
+
+
+def synthetic_corpus(records: int, seed: int = 0) -> List[dict]:
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(records):
+        sentences = []
+        for _ in range(rng.randint(10, 30)):
+            name = rng.choice(NAMES)
+            sentences.append(
+                rng.choice(SENTENCES).format(
+                    name=name,
+                    email=f"{name.split()[0].lower()}@uni-example.de",
+                    phone=f"+49 30 {rng.randint(1000000, 9999999)}",
+                    number=rng.randint(1, 999),
+                    city=rng.choice(CITIES),
+                )
+            )
+        corpus.append(
+            {"text": " ".join(sentences), "metadata": {"url": f"https://example.de/page/{i}", "title": f"Page {i}"}}
+        )
+    return corpus
+
+
+def notebook_baseline(corpus: List[dict]) -> dict:
+    import spacy
+
+    nlp = spacy.load(CLEANING_SPACY_MODEL)
+
+    def clean(text):
+        text = re.sub(r"\S+@\S+", "[EMAIL]", text)
+        text = re.sub(r"\+?\d[\d -]{8,}\d", "[PHONE]", text)
+        for ent in reversed([e for e in nlp(text).ents if e.label_ == "PERSON"]):
+            text = text[:ent.start_char] + "[NAME]" + text[ent.end_char:]
+        text = re.sub(
+            r"\d{1,5}\s\w+\s(?:Street|St|Avenue|Ave|Boulevard|Blvd|Road|Rd|Lane|Ln|Drive|Dr)\b[\w\s,.-]*",
+            "[ADDRESS]",
+            text,
+        )
+        for ent in reversed([e for e in nlp(text).ents if e.label_ in ("GPE", "LOC")]):
+            text = text[:ent.start_char] + "[LOCATION]" + text[ent.end_char:]
+        return text
+
+    started = time.perf_counter()
+    for record in corpus:
+        clean(record["text"])
+    return _result("notebook", len(corpus), time.perf_counter() - started)
+
+
+def cleaner_run(name: str, corpus: List[dict], workers: int, cache_path: str) -> dict:
+    cleaner = PIICleaner(workers=workers, cache_path=cache_path)
+    # One batch per worker first, so loading the model is not measured.
+    warm_up = min(max(workers, 1) * CLEANING_BATCH_SIZE, len(corpus) // 2)
+    try:
+        list(cleaner.clean_records(corpus[:warm_up]))
+        cleaner.stats.cache_hits = 0
+        started = time.perf_counter()
+        cleaned = sum(1 for _ in cleaner.clean_records(corpus[warm_up:]))
+        elapsed = time.perf_counter() - started
+    finally:
+        cleaner.close()
+    return {**_result(name, cleaned, elapsed), "cache_hits": cleaner.stats.cache_hits}
+
+
+def _result(name: str, records: int, elapsed: float) -> dict:
+    return {
+        "mode": name,
+        "records": records,
+        "elapsed_seconds": round(elapsed, 3),
+        "records_per_second": round(records / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--skip-baseline", action="store_true", help="Do not run the slow notebook version")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.records)
+    results = []
+    if not args.skip_baseline:
+        results.append(notebook_baseline(corpus))
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, "cleaning.sqlite3")
+        results.append(cleaner_run("single process", corpus, 0, None))
+        results.append(cleaner_run(f"{args.workers} workers", corpus, args.workers, cache_path))
+        results.append(cleaner_run("cached rerun", corpus, args.workers, cache_path))
+
+    for result in results:
+        print(f"{result['mode']:>16}: {result['records_per_second']:>8} records/s ({result['elapsed_seconds']} s)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Offline benchmark of the ingestion embedder against a simulated embedding API.
+
+Usage:
+    python benchmarks/embedding_benchmark.py [--texts 5000] [--latency 0.2] [--rpm 600] [--tpm 5000000] [--output results.json]
+
+The stub answers each batch after ``--latency`` seconds and returns a 429 once
+more than ``--rpm`` requests were made within a minute, like the real API.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from collections import deque
+from typing import List
+
+import rootutils
+
+rootutils.setup_root(__file__, indicator=".project_root", pythonpath=True)
+
+from llama_index.core.base.embeddings.base import BaseEmbedding  # noqa: E402
+from pydantic import PrivateAttr  # noqa: E402
+
+from constants import EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CONCURRENCY  # noqa: E402
+from scripts.embedding_engine import ParallelEmbedder  # noqa: E402
+
+
+class StubRateLimitError(Exception):
+    status_code = 429
+
+
+class StubEmbedding(BaseEmbedding):
+    """Deterministic fake embeddings with simulated latency and request quota."""
+
+    latency: float = 0.2
+    requests_per_minute: int = 600
+    dimensions: int = 64
+    _requests: deque = PrivateAttr(default_factory=deque)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StubEmbedding"
+
+    def _vector(self, text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [digest[i % len(digest)] / 255.0 for i in range(self.dimensions)]
+
+    def _check_quota(self):
+        now = time.monotonic()
+        while self._requests and now - self._requests[0] > 60:
+            self._requests.popleft()
+        if len(self._requests) >= self.requests_per_minute:
+            raise StubRateLimitError("Rate limit exceeded")
+        self._requests.append(now)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._vector(text)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._aget_text_embeddings([query]))[0]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self._check_quota()
+        await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+
+def run(concurrency: int, texts: List[str], args) -> dict:
+    model = StubEmbedding(
+        latency=args.latency, requests_per_minute=args.rpm, embed_batch_size=EMBEDDING_BATCH_SIZE
+    )
+    embedder = ParallelEmbedder(model, max_concurrency=concurrency, tokens_per_minute=args.tpm)
+    batches = [texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+    started = time.perf_counter()
+    futures = [embedder.submit(batch) for batch in batches]
+    embedded = sum(len(future.result()) for future in futures)
+    elapsed = time.perf_counter() - started
+    embedder.close()
+    return {
+        "concurrency": concurrency,
+        "texts": embedded,
+        "requests": len(batches),
+        "rate_limited": embedder.rate_limited,
+        "elapsed_seconds": round(elapsed, 3),
+        "texts_per_second": round(embedded / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per simulated request")
+    parser.add_argument("--rpm", type=int, default=600, help="Simulated requests-per-minute quota")
+    parser.add_argument("--tpm", type=int, default=5_000_000, help="Tokens-per-minute budget of the embedder")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    texts = [f"Synthetic chunk {i} about studying in Germany. " * 20 for i in range(args.texts)]
+    results = [run(concurrency, texts, args) for concurrency in (1, EMBEDDING_MAX_CONCURRENCY)]
+    for result in results:
+        print(
+            f"concurrency {result['concurrency']:>2}: {result['texts_per_second']:>8} texts/s, "
+            f"{result['requests']} requests, {result['rate_limited']} rate limited"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""Offline end-to-end load test of ``main.app`` against local upstream stand-ins.
+
+Usage:
+    python benchmarks/load_test.py [--users 20] [--requests 200] [--token-rate 50]
+        [--first-token-latency 0.3] [--answer-tokens 120] [--output load_test.json]
+
+A fake OpenAI-compatible server (streaming chat completions and embeddings)
+runs on one thread, the API on another with an in-memory Qdrant collection,
+and simulated chat users drive ``/query`` over real HTTP from the main
+thread. The report covers throughput, time-to-first-token and total latency
+percentiles, status codes, and how long the API's event loop was blocked.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import socket
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+import rootutils
+
+rootutils.setup_root(__file__, indicator=".project_root", pythonpath=True)
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+import uvicorn  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+from starlette.responses import JSONResponse, StreamingResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+EMBEDDING_DIMENSIONS = 1536
+
+TOPICS = [
+    "How do I apply for a student visa for Germany from {country}?",
+    "What documents does uni-assist need for a master's in {subject}?",
+    "How much money do I need in a blocked account to study {subject} in Germany?",
+    "Can I work part-time while studying {subject} in Germany?",
+    "How do I register my address in {city} after moving to Germany?",
+    "Which health insurance do students in {city} need?",
+    "Are there tuition fees for {subject} at public universities in Germany?",
+    "How do I find student housing in {city}?",
+]
+FOLLOW_UPS = ["and how much does it cost?", "how long does that take?", "what about {city}?"]
+SMALL_TALK = ["hi there!", "thanks, that helps", "tell me a joke about cats"]
+COUNTRIES = ["India", "Brazil", "Nigeria", "Vietnam", "Turkey", "Mexico"]
+SUBJECTS = ["computer science", "mechanical engineering", "economics", "medicine", "physics"]
+CITIES = ["Berlin", "Munich", "Hamburg", "Cologne", "Leipzig", "Aachen"]
+
+
+def fake_embedding(text: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSIONS).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_fake_openai(token_rate: float, first_token_latency: float, answer_tokens: int, embedding_latency: float):
+    """Starlette app imitating the chat completion and embedding endpoints."""
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        prompt = json.dumps(body.get("messages", []))
+        await asyncio.sleep(first_token_latency)
+
+        if not body.get("stream"):
+            content = (
+                json.dumps({"is_germany_related": "germany" in prompt.lower()})
+                if "query classifier" in prompt
+                else "Standalone question about studying in Germany"
+            )
+            return JSONResponse({
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 8, "total_tokens": len(prompt) // 4 + 8},
+            })
+
+        async def events():
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            for i in range(answer_tokens):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": f"tok{i} "}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(1 / token_rate)
+            usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": answer_tokens,
+                     "total_tokens": len(prompt) // 4 + answer_tokens}
+            final = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [], "usage": usage}
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(embedding_latency)
+        data = []
+        for index, text in enumerate(inputs):
+            vector = fake_embedding(str(text))
+            encoded = (
+                base64.b64encode(vector.tobytes()).decode("ascii")
+                if body.get("encoding_format") == "base64"
+                else vector.tolist()
+            )
+            data.append({"object": "embedding", "index": index, "embedding": encoded})
+        tokens = sum(len(str(text)) // 4 for text in inputs)
+        return JSONResponse({"object": "list", "data": data, "model": body.get("model"),
+                             "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    return Starlette(routes=[
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/embeddings", embeddings, methods=["POST"]),
+    ])
+
+
+class LoopMonitor:
+    """Measures how late a periodic timer fires on the loop it runs on."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def report(self, threshold: float = 0.05) -> dict:
+        blocked = [lag for lag in self.lags if lag >= threshold]
+        return {
+            "samples": len(self.lags),
+            "lag_ms_p50": round(_percentile(self.lags, 0.50) * 1000, 2),
+            "lag_ms_p99": round(_percentile(self.lags, 0.99) * 1000, 2),
+            "lag_ms_max": round(max(self.lags, default=0.0) * 1000, 2),
+            "blocked_seconds": round(sum(blocked), 3),
+            "blocked_threshold_ms": threshold * 1000,
+        }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app, port: int, on_started=None, monitor: Optional[LoopMonitor] = None) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    ready = threading.Event()
+
+    async def serve():
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            if serving.done():
+                ready.set()
+                await serving
+                return
+            await asyncio.sleep(0.05)
+        try:
+            if on_started is not None:
+                await on_started()
+            if monitor is not None:
+                asyncio.create_task(monitor.run())
+        finally:
+            ready.set()
+        await serving
+
+    threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+    ready.wait()
+    return server
+
+
+async def seed_collection(app, collection_name: str, documents: int):
+    """Write synthetic chunks with fake embeddings into the app's Qdrant."""
+    from llama_index.core.schema import TextNode
+    from llama_index.vector_stores.qdrant import QdrantVectorStore
+
+    vector_store = QdrantVectorStore(aclient=app.state.qdrant_client, collection_name=collection_name)
+    nodes = []
+    for i in range(documents):
+        template = TOPICS[i % len(TOPICS)]
+        text = template.format(country=COUNTRIES[i % 6], subject=SUBJECTS[i % 5], city=CITIES[i % 6])
+        text = f"{text} " + "Detailed guidance from the official study-in-germany pages. " * 20
+        nodes.append(TextNode(
+            text=text,
+            metadata={"url": f"https://example.org/page/{i}", "title": f"Page {i}"},
+            embedding=fake_embedding(text).tolist(),
+        ))
+    await vector_store.async_add(nodes)
+
+
+def conversation(rng: random.Random) -> List[str]:
+    """The user turns of one simulated chat."""
+    fill = {"country": rng.choice(COUNTRIES), "subject": rng.choice(SUBJECTS), "city": rng.choice(CITIES)}
+    if rng.random() < 0.15:
+        return [rng.choice(SMALL_TALK)]
+    turns = [rng.choice(TOPICS).format(**fill)]
+    for _ in range(rng.randint(0, 2)):
+        turns.append(rng.choice(FOLLOW_UPS).format(**fill))
+    return turns
+
+
+async def send_query(client: httpx.AsyncClient, messages: List[dict], conversation_id: str) -> dict:
+    started = time.perf_counter()
+    result = {"status": None, "ttft": None, "total": None, "answer": "", "error": None}
+    payload = {"messages": messages, "conversation_id": conversation_id, "model_name": "gpt-4o-mini"}
+    async with client.stream("POST", "/query", json=payload) as response:
+        result["status"] = response.status_code
+        if response.status_code != 200:
+            await response.aread()
+            return result
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event == "token":
+                if result["ttft"] is None:
+                    result["ttft"] = time.perf_counter() - started
+                result["answer"] += json.loads(line[len("data: "):])["text"]
+            elif line.startswith("data: ") and event == "error":
+                result["error"] = json.loads(line[len("data: "):])["error"]
+            elif line.startswith("data: ") and event == "done":
+                break
+    result["total"] = time.perf_counter() - started
+    return result
+
+
+async def drive_traffic(base_url: str, users: int, requests: int, seed: int) -> tuple:
+    results: List[dict] = []
+    remaining = [requests]
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+
+    async def user(index: int):
+        rng = random.Random(seed + index)
+        # Each simulated user is a separate client to the per-client admission cap.
+        headers = {"X-Forwarded-For": f"10.0.{index // 256}.{index % 256}"}
+        async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits, headers=headers) as client:
+            while remaining[0] > 0:
+                messages: List[dict] = []
+                conversation_id = uuid.uuid4().hex
+                for turn in conversation(rng):
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                    messages.append({"role": "user", "content": turn})
+                    result = await send_query(client, messages, conversation_id)
+                    results.append(result)
+                    messages.append({"role": "assistant", "content": result["answer"] or "..."})
+                    await asyncio.sleep(rng.uniform(0.0, 0.2))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(users)))
+    return results, time.perf_counter() - started
+
+
+def summarize(results: List[dict], elapsed: float) -> dict:
+    completed = [r for r in results if r["status"] == 200 and r["total"] is not None and not r["error"]]
+    ttfts = [r["ttft"] for r in completed if r["ttft"] is not None]
+    totals = [r["total"] for r in completed]
+    statuses: dict = {}
+    for r in results:
+        key = str(r["status"]) if not r["error"] else "stream_error"
+        statuses[key] = statuses.get(key, 0) + 1
+    return {
+        "requests": len(results),
+        "completed": len(completed),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(completed) / elapsed, 2) if elapsed else 0.0,
+        "statuses": statuses,
+        "ttft_ms": _latency_summary(ttfts),
+        "total_ms": _latency_summary(totals),
+    }
+
+
+def _latency_summary(values: List[float]) -> dict:
+    if not values:
+        return {}
+    return {
+        "p50": round(_percentile(values, 0.50) * 1000, 1),
+        "p95": round(_percentile(values, 0.95) * 1000, 1),
+        "p99": round(_percentile(values, 0.99) * 1000, 1),
+        "mean": round(statistics.mean(values) * 1000, 1),
+    }
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="Concurrent simulated chat users")
+    parser.add_argument("--requests", type=int, default=200, help="Total /query requests to send")
+    parser.add_argument("--token-rate", type=float, default=50, help="Streamed tokens per second per answer")
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="Seconds before the first token")
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--documents", type=int, default=500, help="Chunks in the in-memory collection")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_test_results.json", help="JSON file for the results")
+    args = parser.parse_args()
+
+    openai_port, api_port = free_port(), free_port()
+    cache_dir = tempfile.mkdtemp(prefix="unillm-load-test-")
+    os.environ.update({
+        "OPENAI_API_KEY": "load-test",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "OPENAI_API_BASE": f"http://127.0.0.1:{openai_port}/v1",
+        "QDRANT_URL": ":memory:",
+        "ENVIRONMENT": "load-test",
+        "EMBEDDING_CACHE_PATH": os.path.join(cache_dir, "embeddings.sqlite3"),
+        # The simulated users reach the API through loopback, acting as a proxy.
+        "TRUSTED_PROXIES": "127.0.0.1",
+    })
+
+    import main as api  # noqa: E402 - reads the environment above
+    from config import DEFAULT_COLLECTION_NAME
+
+    start_server(
+        create_fake_openai(args.token_rate, args.first_token_latency, args.answer_tokens, args.embedding_latency),
+        openai_port,
+    )
+    monitor = LoopMonitor()
+    start_server(
+        api.app,
+        api_port,
+        on_started=lambda: seed_collection(api.app, DEFAULT_COLLECTION_NAME, args.documents),
+        monitor=monitor,
+    )
+
+    results, elapsed = asyncio.run(
+        drive_traffic(f"http://127.0.0.1:{api_port}", args.users, args.requests, args.seed)
+    )
+    report = {
+        "config": vars(args),
+        "results": summarize(results, elapsed),
+        "event_loop": monitor.report(),
+    }
+    print(json.dumps(report["results"], indent=4))
+    print(json.dumps(report["event_loop"], indent=4))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Recall of dense and hybrid retrieval against a live Qdrant collection.
+
+Usage:
+    python benchmarks/retrieval_benchmark.py [--collection study-in-germany]
+        [--candidates 5 10 20 40] [--output results.json]
+
+Needs the Qdrant settings from ``.env`` and the embedding backend the
+collection was built with. Each query in ``data/retrieval/eval.jsonl`` lists
+phrases that mark a relevant chunk; a query counts as recalled when one of
+the ``MAX_SOURCES`` chunks that reach the prompt contains one. Hybrid
+retrieval is measured once per candidate depth, so ``HYBRID_CANDIDATES`` can
+be set to the smallest depth after which recall@k stops improving.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+
+import rootutils
+
+rootutils.setup_root(__file__, indicator=".project_root", pythonpath=True)
+
+from llama_index.core.indices.vector_store.base import VectorStoreIndex  # noqa: E402
+from llama_index.core.settings import Settings  # noqa: E402
+from llama_index.vector_stores.qdrant.base import QdrantVectorStore  # noqa: E402
+
+from app.utils.clients import create_query_embed_model  # noqa: E402
+from app.utils.sparse_index import HybridRetriever, build_sparse_index  # noqa: E402
+from app.utils.storage_utils import initialize_async_qdrant_client  # noqa: E402
+from config import DEFAULT_COLLECTION_NAME, ENVIRONMENT, QDRANT_API_KEY, QDRANT_URL  # noqa: E402
+from constants import MAX_SOURCES, SIMILARITY_CUTOFF  # noqa: E402
+
+EVAL_SET_PATH = Path(__file__).resolve().parent.parent / "data" / "retrieval" / "eval.jsonl"
+
+
+def load_eval_set(path=EVAL_SET_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _is_relevant(node, phrases):
+    text = f"{node.node.metadata.get('url', '')} {node.node.get_content()}".lower()
+    return any(phrase in text for phrase in phrases)
+
+
+async def _evaluate(name, retriever, examples):
+    recalled, latencies = 0, []
+    for example in examples:
+        start = time.perf_counter()
+        nodes = await retriever.aretrieve(example["query"])
+        latencies.append(time.perf_counter() - start)
+        recalled += any(_is_relevant(node, example["relevant"]) for node in nodes[:MAX_SOURCES])
+    return {
+        "retriever": name,
+        "queries": len(examples),
+        f"recall_at_{MAX_SOURCES}": recalled / len(examples),
+        "latency_ms_mean": statistics.mean(latencies) * 1000,
+    }
+
+
+async def run(collection_name, depths):
+    Settings.embed_model = create_query_embed_model()
+    client = initialize_async_qdrant_client(QDRANT_URL, QDRANT_API_KEY, ENVIRONMENT)
+    vector_store = QdrantVectorStore(aclient=client, collection_name=collection_name, prefer_grpc=True)
+    index = VectorStoreIndex.from_vector_store(vector_store)
+    sparse_index = await build_sparse_index(client, vector_store, collection_name)
+    examples = load_eval_set()
+
+    results = [await _evaluate("dense", index.as_retriever(similarity_top_k=MAX_SOURCES), examples)]
+    for depth in depths:
+        retriever = HybridRetriever(
+            index.as_retriever(similarity_top_k=depth),
+            sparse_index,
+            top_k=MAX_SOURCES,
+            candidates=depth,
+            similarity_cutoff=SIMILARITY_CUTOFF,
+        )
+        results.append({**await _evaluate(f"hybrid@{depth}", retriever, examples), "candidates": depth})
+    await client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION_NAME)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[5, 10, 20, 40])
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.collection, args.candidates))
+    for result in results:
+        print(
+            f"{result['retriever']:>10}: recall@{MAX_SOURCES} {result[f'recall_at_{MAX_SOURCES}']:.1%}, "
+            f"mean {result['latency_ms_mean']:.1f} ms"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,7 @@ DEFAULT_HUGGINGFACE_MODEL_NAME = "meta-llama/Meta-Llama-3-8B-Instruct"
 
 class ChatContext(BaseModel):
     messages: List[dict]
+    conversation_id: Optional[str] = None
     collection_name: Optional[str] = "study-in-germany"
     model_name: Optional[str] = "gpt-4"
     temperature: Optional[float] = 0.0
@@ -25,4 +26,23 @@ class QueryResponse(BaseModel):
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 QDRANT_URL = os.getenv("QDRANT_URL")
 ENVIRONMENT = os.getenv("ENVIRONMENT")
-ORIGIN = os.getenv("ORIGIN")
\ No newline at end of file
+ORIGIN = os.getenv("ORIGIN")
+
+# Connection pooling for the shared upstream clients
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+QDRANT_MAX_CONNECTIONS = int(os.getenv("QDRANT_MAX_CONNECTIONS", "50"))
+QDRANT_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("QDRANT_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("KEEPALIVE_EXPIRY", "30"))
+
+# Proxies whose X-Forwarded-For header is trusted to identify clients for admission control
+TRUSTED_PROXIES = [p.strip() for p in os.getenv("TRUSTED_PROXIES", "").split(",") if p.strip()]
+
+# Export timing spans as OpenTelemetry traces (needs opentelemetry-api and an SDK)
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "").lower() in ("1", "true", "yes")
+
+# On-disk embedding cache shared by the API and the ingestion scripts
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+
+# Cache of PII-cleaned texts used by scripts/pii_cleaning.py
+CLEANING_CACHE_PATH = os.getenv("CLEANING_CACHE_PATH", ".cache/cleaning.sqlite3")
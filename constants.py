@@ -1,4 +1,3 @@
-SIMILARITY_CUTOFF = 0.75
 CONFIDENCE_SCORE_THRESHOLD = 0.9
 MAX_SOURCES = 5
 CENTRAL_LLM_MODEL = "gpt-4o-mini"
@@ -8,3 +7,61 @@ CHUNK_SIZE = 512
 CHUNK_OVERLAP = 50
 SIMILARITY_TOP_K = 10
 SIMILARITY_CUTOFF = 0.78
+RETRIEVER_HEALTH_CHECK_INTERVAL = 300
+SPECULATIVE_RETRIEVAL = True
+QUERY_CLASSIFIER_BACKEND = "cascade"  # "llm", "keyword", "ngram" or "cascade"
+CLASSIFIER_UNSURE_BAND = (0.2, 0.8)
+INGESTION_MARKER_KEY = "ingested_at"
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_MAX_ENTRIES = 1000
+ANSWER_CACHE_TTL = 24 * 60 * 60
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+EMBEDDING_CACHE_MEMORY_ENTRIES = 10000
+INGESTION_BATCH_SIZE = 256
+INGESTION_QUEUE_SIZE = 8
+EMBEDDING_BATCH_SIZE = 256
+EMBEDDING_MAX_CONCURRENCY = 8
+EMBEDDING_TOKENS_PER_MINUTE = 1_000_000
+EMBEDDING_MAX_RETRIES = 8
+EMBEDDING_BACKEND = "openai"  # "openai" or "huggingface"
+LOCAL_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+LOCAL_EMBEDDING_MAX_LENGTH = 512
+LOCAL_EMBEDDING_BATCH_SIZE = 64
+LOCAL_EMBEDDING_QUANTIZE = False
+LOCAL_EMBEDDING_ONNX = False
+HYBRID_RETRIEVAL = True
+HYBRID_CANDIDATES = 20  # per retriever; pick from benchmarks/retrieval_benchmark.py
+RRF_K = 60
+CONTEXT_TOKEN_BUDGET = 2000
+CONTEXT_OVERLAP_THRESHOLD = 0.6
+HISTORY_KEEP_TURNS = 3
+HISTORY_TOKEN_BUDGET = 2000
+HISTORY_SUMMARY_MAX_TOKENS = 300
+HISTORY_SUMMARY_MODEL = CENTRAL_LLM_MODEL
+HISTORY_CACHE_MAX_ENTRIES = 5000
+QUERY_REWRITE_MODEL = CENTRAL_LLM_MODEL
+QUERY_REWRITE_HISTORY_TURNS = 4
+QUERY_REWRITE_CACHE_MAX_ENTRIES = 5000
+SSE_HEARTBEAT_INTERVAL = 15
+SSE_COALESCE_INTERVAL = 0.05
+SSE_MAX_CHUNK_CHARS = 2048
+SSE_DISCONNECT_POLL_INTERVAL = 0.5
+SSE_QUEUE_SIZE = 64
+ADMISSION_GLOBAL_CONCURRENCY = 64
+ADMISSION_PER_CLIENT_CONCURRENCY = 4
+ADMISSION_LANE_CONCURRENCY = {"germany": 48, "general": 32}
+ADMISSION_QUEUE_SIZE = 128
+ADMISSION_QUEUE_TIMEOUT = 10
+CRAWL_SCROLL_MAX_STEPS = 10
+CRAWL_SCROLL_IDLE_MS = 750
+CRAWL_SCROLL_TIMEOUT_MS = 8000
+CLEANING_SPACY_MODEL = "en_core_web_sm"
+CLEANING_BATCH_SIZE = 64
+DEDUP_ENABLED = True
+DEDUP_SHINGLE_SIZE = 5
+DEDUP_MINHASH_PERMUTATIONS = 128
+DEDUP_MINHASH_BANDS = 16
+DEDUP_DOCUMENT_THRESHOLD = 0.85
+DEDUP_CHUNK_MAX_DISTANCE = 3
+BOILERPLATE_MIN_DOCUMENTS = 5
+BOILERPLATE_MIN_FRACTION = 0.3
@@ -1,20 +1,35 @@
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from loguru import logger
+import time
+from app.utils.admission import AdmissionRejected, client_identifier
 from app.utils.router import CentralController
-from app.utils.storage_utils import initialize_qdrant_client
+from app.utils.clients import close_clients, open_clients
+from app.utils.sse import sse_events
+from app.utils.telemetry import observe_stream, render_metrics, span
 from config import (
     QDRANT_API_KEY, QDRANT_URL, ENVIRONMENT, ChatContext,
-    ORIGIN
+    ORIGIN, DEFAULT_COLLECTION_NAME
 )
 from fastapi.responses import JSONResponse
-import json
 
 load_dotenv()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    open_clients(app, QDRANT_URL, QDRANT_API_KEY, ENVIRONMENT)
+    try:
+        yield
+    finally:
+        await close_clients(app)
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,34 +44,37 @@ app.add_middleware(
 )
 
 
-async def stream_response(stream_response, sources):
-    """Convert OpenAI streaming response to our format"""
-    try:
-        for source in sources:
-            yield f"source:{json.dumps(source)}"
-        async for chunk in stream_response:
-            if chunk.choices[0].delta.content:
-                content = chunk.choices[0].delta.content
-                yield content
-    except Exception as e:
-        logger.error(f"Streaming error: {e}")
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
-
 @app.post("/query")
-async def query_endpoint(chatContext: ChatContext):
+async def query_endpoint(chatContext: ChatContext, request: Request):
     if not chatContext.messages:
         raise HTTPException(status_code=400, detail="Messages are required.")
-    
+
+    started = time.perf_counter()
+    try:
+        with span("admission"):
+            ticket = await request.app.state.admission.admit(client_identifier(request))
+    except AdmissionRejected as e:
+        return _rejection_response(e)
+
     central_controller = CentralController(
         model_name=chatContext.model_name,
-        temperature=chatContext.temperature
+        temperature=chatContext.temperature,
+        client=request.app.state.llm_client,
+        collection_name=chatContext.collection_name or DEFAULT_COLLECTION_NAME,
+        answer_cache=request.app.state.answer_cache,
+        history=request.app.state.history,
+        query_rewriter=request.app.state.query_rewriter,
+        conversation_id=chatContext.conversation_id,
+        admission_ticket=ticket,
+        single_flight=request.app.state.single_flight,
     )
-    client = initialize_qdrant_client(QDRANT_URL, QDRANT_API_KEY, ENVIRONMENT)
+    retrievers = request.app.state.retrievers
     
     try:
-        result = await central_controller.process_query(client=client, messages=chatContext.messages)
+        result = await central_controller.process_query(retrievers=retrievers, messages=chatContext.messages)
         
         if not result or "answer" not in result:
+            ticket.release()
             return JSONResponse(
                 content={
                     "answer": "Sorry, but it seems there was an error with my database. Please try again later.",
@@ -68,15 +86,22 @@ async def query_endpoint(chatContext: ChatContext):
         stream_response_obj = result["answer"]
         
         return StreamingResponse(
-            stream_response(stream_response_obj, sources),
+            sse_events(ticket.release_after(observe_stream(stream_response_obj, started)), sources, request),
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
-            }
+                "X-Accel-Buffering": "no",
+            },
+            # Covers responses whose stream never started.
+            background=BackgroundTask(ticket.release),
         )
-        
+
+    except AdmissionRejected as e:
+        ticket.release()
+        return _rejection_response(e)
     except Exception as e:
+        ticket.release()
         logger.error(f"Query processing error: {e}")
         return JSONResponse(
             content={
@@ -86,6 +111,19 @@ async def query_endpoint(chatContext: ChatContext):
             status_code=500
         )
 
+def _rejection_response(rejection: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        content={"detail": rejection.detail},
+        status_code=rejection.status_code,
+        headers={"Retry-After": str(rejection.retry_after)},
+    )
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Germany Study Info API"}
@@ -0,0 +1,157 @@
+"""Persistent per-spider crawl state for incremental recrawls.
+
+For every page the frontier keeps the last fetch time, the ``ETag`` and
+``Last-Modified`` validators, a hash of the extracted content and the links
+followed from it. On a recrawl pages are requested conditionally; a ``304``
+is answered from the stored links, and a page whose content hash did not
+change is emitted again only as an ``unchanged_record`` marker, so consumers
+can tell a page that is still there from one that disappeared.
+
+Validators and the content hash of a page are staged while it is parsed and
+only written once its item was handed off (``mark_emitted``, called from the
+``item_scraped`` signal). A page whose item was dropped is therefore fetched
+and emitted in full again on the next crawl.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Writes are committed in batches; a crash loses at most this many pages.
+COMMIT_EVERY = 50
+
+# Metadata flag of the records emitted for pages that did not change.
+UNCHANGED_KEY = "unchanged"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    links TEXT NOT NULL DEFAULT '[]'
+)
+"""
+
+
+@dataclass
+class FrontierEntry:
+    url: str
+    fetched_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    links: List[str] = field(default_factory=list)
+
+
+def content_hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def unchanged_record(url: str) -> dict:
+    """The record emitted for a page that is still there but did not change."""
+    return {"text": "", "metadata": {"url": url, UNCHANGED_KEY: True}}
+
+
+def is_unchanged(record: dict) -> bool:
+    return bool(record.get("metadata", {}).get(UNCHANGED_KEY))
+
+
+def _header(headers, name: str) -> Optional[str]:
+    value = headers.get(name) if headers is not None else None
+    if isinstance(value, bytes):
+        value = value.decode("latin-1")
+    return value or None
+
+
+class CrawlFrontier:
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        self._pending = 0
+        self._staged: Dict[str, Tuple[Optional[str], Optional[str], str]] = {}
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def get(self, url: str) -> Optional[FrontierEntry]:
+        row = self._conn.execute(
+            "SELECT url, fetched_at, etag, last_modified, content_hash, links FROM pages WHERE url = ?",
+            (url,),
+        ).fetchone()
+        if row is None:
+            return None
+        return FrontierEntry(*row[:5], links=json.loads(row[5]))
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        entry = self.get(url)
+        headers = {}
+        # Without a content hash the page was never handed off; fetch it in full.
+        if entry is not None and entry.content_hash:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def record(self, url: str, links: List[str]):
+        """Store the links followed from ``url``; validators and hash are left as they were."""
+        self._conn.execute(
+            "INSERT INTO pages (url, fetched_at, links) VALUES (?, ?, ?) "
+            "ON CONFLICT(url) DO UPDATE SET fetched_at = excluded.fetched_at, links = excluded.links",
+            (url, time.time(), json.dumps(links)),
+        )
+        self._written()
+
+    def stage(self, url: str, response_headers, page_hash: str):
+        """Remember what to store for ``url`` once its item was handed off."""
+        self._staged[url] = (
+            _header(response_headers, "ETag"),
+            _header(response_headers, "Last-Modified"),
+            page_hash,
+        )
+
+    def mark_emitted(self, url: str):
+        staged = self._staged.pop(url, None)
+        if staged is None:
+            return
+        self._conn.execute(
+            "INSERT INTO pages (url, fetched_at, etag, last_modified, content_hash) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(url) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified, "
+            "content_hash = excluded.content_hash",
+            (url, time.time(), *staged),
+        )
+        self._written()
+
+    def touch(self, url: str, response_headers=None):
+        """Mark an unchanged page as fetched now, keeping any refreshed validators."""
+        self._conn.execute(
+            "UPDATE pages SET fetched_at = ?, etag = COALESCE(?, etag), "
+            "last_modified = COALESCE(?, last_modified) WHERE url = ?",
+            (
+                time.time(),
+                _header(response_headers, "ETag"),
+                _header(response_headers, "Last-Modified"),
+                url,
+            ),
+        )
+        self._written()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def _written(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._conn.commit()
+            self._pending = 0
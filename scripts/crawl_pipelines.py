@@ -0,0 +1,113 @@
+"""Scrapy item pipeline that hands crawled pages straight to ingestion.
+
+Enabled by setting ``INGESTION_COLLECTION``, e.g.::
+
+    scrapy runspider scripts/study_in_germany_crawler.py -s INGESTION_COLLECTION=study-in-germany
+
+Items are the ``{text, metadata}`` records written to the JSON Lines feed.
+They are queued for an ``IngestionPipeline`` running in a background thread,
+so pages are split and embedded while the crawl is still running. Personal
+information is removed with ``PIICleaner`` on the way, unless
+``INGESTION_CLEAN_PII`` is set to false.
+
+Ingestion is incremental: a changed page replaces the chunks stored for its
+URL, and unchanged-page markers are not queued. Once ingestion has failed,
+items are dropped, so the crawl frontier does not record them as handed off.
+"""
+import logging
+import queue
+import threading
+from typing import Iterator, Optional
+
+from scrapy.exceptions import DropItem, NotConfigured
+from twisted.internet import threads
+
+from config import ENVIRONMENT, QDRANT_API_KEY, QDRANT_URL
+from constants import INGESTION_QUEUE_SIZE
+from scripts.crawl_frontier import is_unchanged
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionItemPipeline:
+    def __init__(self, collection_name: str, clean_pii: bool = True, queue_size: int = INGESTION_QUEUE_SIZE):
+        self.collection_name = collection_name
+        self.clean_pii = clean_pii
+        self._records: queue.Queue = queue.Queue(queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+        self._error: Optional[BaseException] = None
+        self.report: Optional[dict] = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        collection_name = crawler.settings.get("INGESTION_COLLECTION")
+        if not collection_name:
+            raise NotConfigured("INGESTION_COLLECTION is not set")
+        return cls(collection_name, clean_pii=crawler.settings.getbool("INGESTION_CLEAN_PII", True))
+
+    def open_spider(self, spider):
+        self._thread = threading.Thread(target=self._ingest, name="ingestion", daemon=True)
+        self._thread.start()
+
+    def process_item(self, item, spider):
+        if self._error is not None:
+            raise DropItem(f"Ingestion failed: {self._error}")
+        if is_unchanged(item):
+            return item
+        # Blocking on a full queue in a worker thread throttles the crawl to
+        # the ingestion rate without stalling the reactor.
+        return threads.deferToThread(self._enqueue, item)
+
+    def close_spider(self, spider):
+        self._closed.set()
+        if self._thread is not None:
+            return threads.deferToThread(self._finish)
+
+    def _enqueue(self, item):
+        record = {"text": item["text"], "metadata": dict(item["metadata"])}
+        while self._error is None:
+            try:
+                self._records.put(record, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        else:
+            raise DropItem(f"Ingestion failed: {self._error}")
+        return item
+
+    def _records_iter(self) -> Iterator[dict]:
+        while True:
+            try:
+                record = self._records.get(timeout=0.1)
+            except queue.Empty:
+                if self._closed.is_set() and self._records.empty():
+                    return
+                continue
+            yield record
+
+    def _ingest(self):
+        from app.utils.storage_utils import initialize_qdrant_client, mark_collection_ingested
+        from scripts.ingestion_pipeline import ingest_records
+        from scripts.pii_cleaning import PIICleaner
+
+        cleaner = None
+        try:
+            records = self._records_iter()
+            if self.clean_pii:
+                cleaner = PIICleaner()
+                records = cleaner.clean_records(records)
+            client = initialize_qdrant_client(QDRANT_URL, QDRANT_API_KEY, ENVIRONMENT)
+            self.report = ingest_records(client, self.collection_name, records, incremental=True)
+            mark_collection_ingested(client, self.collection_name)
+        except BaseException as e:
+            logger.error(f"Ingestion of crawled pages failed: {e}", exc_info=True)
+            self._error = e
+        finally:
+            if cleaner is not None:
+                cleaner.close()
+
+    def _finish(self):
+        self._thread.join()
+        if self.report is not None:
+            logger.info(f"Ingested crawled pages into {self.collection_name}: {self.report}")
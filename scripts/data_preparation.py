@@ -1,40 +1,108 @@
+import hashlib
 import json
 import logging
-from typing import Optional
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse
 
 from llama_index.core.node_parser.text.sentence import SentenceSplitter
 from llama_index.core import StorageContext
 from llama_index.core.indices.vector_store.base import VectorStoreIndex
-from llama_index.core.schema import Document
+from llama_index.core.schema import Document, MetadataMode
 from llama_index.core.settings import Settings
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.vector_stores.qdrant.base import QdrantVectorStore
-from transformers import AutoModel, AutoTokenizer
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from constants import CHUNK_OVERLAP, CHUNK_SIZE, QDRANT_EMBEDDING_MODEL
+from qdrant_client.http import models as rest
+from app.utils.embedding_cache import CachedEmbedding, EmbeddingCache
+from app.utils.local_embedding import LocalEmbedding
+from app.utils.storage_utils import mark_collection_ingested
+from config import EMBEDDING_CACHE_PATH
+from constants import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCH_SIZE,
+    LOCAL_EMBEDDING_MODEL,
+    LOCAL_EMBEDDING_ONNX,
+    LOCAL_EMBEDDING_QUANTIZE,
+    QDRANT_EMBEDDING_MODEL,
+)
+from scripts.crawl_frontier import is_unchanged
 
 logger = logging.getLogger(__name__)
 
+# Payload keys used by incremental ingestion; never embedded or shown to the LLM.
+HASH_METADATA_KEYS = ["doc_hash", "chunk_hash"]
+
+
+@dataclass
+class IngestionDiff:
+    documents_added: int = 0
+    documents_updated: int = 0
+    documents_unchanged: int = 0
+    documents_deleted: int = 0
+    chunks_upserted: int = 0
+    chunks_deleted: int = 0
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(
+            self.documents_added or self.documents_updated or self.documents_deleted
+        )
+
+    def __str__(self) -> str:
+        return (
+            f"documents: {self.documents_added} added, {self.documents_updated} updated, "
+            f"{self.documents_unchanged} unchanged, {self.documents_deleted} deleted; "
+            f"chunks: {self.chunks_upserted} upserted, {self.chunks_deleted} deleted"
+        )
+
+
 def store_in_qdrant(
     client,
     collection_name: Optional[str] = "study-in-germany",
     file_path: Optional[str] = "./data/",
+    incremental: bool = False,
 ):
+    """Embed the entries of ``file_path`` and store them in ``collection_name``.
+
+    With ``incremental=True`` only new or changed documents are chunked and
+    embedded, and points of URLs that disappeared from the file are deleted.
+    Unchanged-page markers written by the crawlers keep their URL's points.
+    Returns the ``IngestionDiff`` in that case.
+    """
     data = _load_data(file_path)
-    documents = _create_documents(data)
-    vector_store = _initialize_vector_store(client, collection_name)
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
     _configure_settings()
-    _store_documents(documents, storage_context)
-    logger.info("Data stored in Qdrant!")
+    try:
+        if incremental:
+            diff = _store_incrementally(client, str(collection_name), data)
+            if diff.has_changes:
+                mark_collection_ingested(client, collection_name)
+            logger.info(f"Incremental ingestion finished: {diff}")
+            return diff
+
+        documents = _create_documents(data)
+        vector_store = _initialize_vector_store(client, collection_name)
+        storage_context = StorageContext.from_defaults(vector_store=vector_store)
+        _store_documents(documents, storage_context)
+        mark_collection_ingested(client, collection_name)
+        logger.info("Data stored in Qdrant!")
+    finally:
+        # Shuts down the local model's worker processes.
+        Settings.embed_model.close()
 
 def _load_data(file_path: str) -> list:
     logging.info(f"Loading data from {file_path}")
-    with open(file_path, "r") as f:
+    with open(file_path, "r", encoding="utf-8") as f:
+        if file_path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
         return json.load(f)
 
 def _create_documents(data: list) -> list:
-    return [Document(text=entry["text"], metadata=entry["metadata"]) for entry in data]
+    return [Document(text=entry["text"], metadata=entry["metadata"]) for entry in data if not is_unchanged(entry)]
 
 def _initialize_vector_store(client, collection_name: str) -> QdrantVectorStore:
     return QdrantVectorStore(
@@ -50,18 +118,34 @@ def _initialize_vector_store(client, collection_name: str) -> QdrantVectorStore:
         },
     )
 
-def _configure_settings(model_type: str = "openai", huggingface_model_name: Optional[str] = None):
+def _configure_settings(
+    model_type: str = EMBEDDING_BACKEND,
+    huggingface_model_name: Optional[str] = LOCAL_EMBEDDING_MODEL,
+    max_retries: Optional[int] = None,
+):
     if model_type == "openai":
-        Settings.embed_model = OpenAIEmbedding(model=QDRANT_EMBEDDING_MODEL)
+        openai_kwargs = {} if max_retries is None else {"max_retries": max_retries}
+        embed_model = OpenAIEmbedding(
+            model=QDRANT_EMBEDDING_MODEL, embed_batch_size=EMBEDDING_BATCH_SIZE, **openai_kwargs
+        )
+        model_name = QDRANT_EMBEDDING_MODEL
     elif model_type == "huggingface" and huggingface_model_name:
-        tokenizer = AutoTokenizer.from_pretrained(huggingface_model_name)
-        model = AutoModel.from_pretrained(huggingface_model_name)
-        Settings.embed_model = HuggingFaceEmbedding(model=model, tokenizer=tokenizer)
+        embed_model = LocalEmbedding(
+            model_name=huggingface_model_name,
+            quantize=LOCAL_EMBEDDING_QUANTIZE,
+            onnx=LOCAL_EMBEDDING_ONNX,
+            num_processes=os.cpu_count() or 1,
+        )
+        model_name = huggingface_model_name
     else:
         raise ValueError("Invalid model type or missing Hugging Face model name")
 
-def _store_documents(documents: list, storage_context: StorageContext):
-    text_splitter = SentenceSplitter(
+    Settings.embed_model = CachedEmbedding(
+        embed_model, EmbeddingCache(EMBEDDING_CACHE_PATH), model_name=model_name
+    )
+
+def _create_text_splitter() -> SentenceSplitter:
+    return SentenceSplitter(
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
         include_metadata=True,
@@ -72,9 +156,138 @@ def _store_documents(documents: list, storage_context: StorageContext):
         secondary_chunking_regex=None,
     )  # type: ignore
 
+
+def _store_documents(documents: list, storage_context: StorageContext):
+    text_splitter = _create_text_splitter()
+
     VectorStoreIndex.from_documents(
         documents,
         storage_context=storage_context,
         show_progress=True,
         text_splitter=text_splitter,
-    ) 
\ No newline at end of file
+    )
+
+
+def _store_incrementally(client, collection_name: str, data: list) -> IngestionDiff:
+    diff = IngestionDiff()
+    vector_store = _initialize_vector_store(client, collection_name)
+    existing = _load_existing_documents(client, collection_name)
+    splitter = _create_text_splitter()
+
+    entries: Dict[str, dict] = {entry["metadata"]["url"]: entry for entry in data}
+    for url, entry in entries.items():
+        if is_unchanged(entry):
+            # The crawler saw the page but did not emit it again; keep what is stored.
+            if url in existing:
+                diff.documents_unchanged += 1
+            else:
+                logger.warning(f"{url} is marked unchanged but not in {collection_name}; recrawl with -a refresh=true")
+            continue
+        doc_hash = _document_hash(entry)
+        previous = existing.get(url)
+        if previous and previous["doc_hash"] == doc_hash:
+            diff.documents_unchanged += 1
+            continue
+
+        metadata = dict(entry["metadata"])
+        if previous and previous.get("date_added"):
+            metadata["date_added"] = previous["date_added"]
+        metadata.setdefault("date_added", datetime.now().isoformat())
+        metadata["doc_hash"] = doc_hash
+
+        nodes = _create_chunk_nodes(splitter, url, entry["text"], metadata)
+        old_ids = previous["point_ids"] if previous else set()
+        new_nodes = [node for node in nodes if node.node_id not in old_ids]
+        stale_ids = old_ids - {node.node_id for node in nodes}
+
+        if new_nodes:
+            embeddings = Settings.embed_model.get_text_embedding_batch(
+                [node.get_content(metadata_mode=MetadataMode.EMBED) for node in new_nodes]
+            )
+            for node, embedding in zip(new_nodes, embeddings):
+                node.embedding = embedding
+            vector_store.add(new_nodes)
+        kept_ids = list(old_ids - stale_ids)
+        if kept_ids:
+            client.set_payload(collection_name, payload={"doc_hash": doc_hash}, points=kept_ids)
+        if stale_ids:
+            client.delete(collection_name, points_selector=rest.PointIdsList(points=list(stale_ids)))
+
+        diff.chunks_upserted += len(new_nodes)
+        diff.chunks_deleted += len(stale_ids)
+        if previous:
+            diff.documents_updated += 1
+        else:
+            diff.documents_added += 1
+
+    # Only prune URLs from the sites present in this file, so sources that are
+    # ingested from separate files into the same collection stay untouched.
+    hosts = {urlparse(url).netloc for url in entries}
+    for url, previous in existing.items():
+        if url not in entries and urlparse(url).netloc in hosts:
+            client.delete(
+                collection_name,
+                points_selector=rest.FilterSelector(
+                    filter=rest.Filter(
+                        must=[rest.FieldCondition(key="url", match=rest.MatchValue(value=url))]
+                    )
+                ),
+            )
+            diff.documents_deleted += 1
+            diff.chunks_deleted += len(previous["point_ids"])
+
+    return diff
+
+
+def _document_hash(entry: dict) -> str:
+    metadata = {k: v for k, v in entry["metadata"].items() if k != "date_added"}
+    payload = json.dumps({"text": entry["text"], "metadata": metadata}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _create_chunk_nodes(splitter: SentenceSplitter, url: str, text: str, metadata: dict) -> list:
+    document = Document(
+        id_=str(uuid.uuid5(uuid.NAMESPACE_URL, url)),
+        text=text,
+        metadata=metadata,
+        excluded_embed_metadata_keys=HASH_METADATA_KEYS + ["date_added"],
+        excluded_llm_metadata_keys=HASH_METADATA_KEYS,
+    )
+    nodes = {}
+    for node in splitter.get_nodes_from_documents([document]):
+        chunk_hash = hashlib.sha256(
+            node.get_content(metadata_mode=MetadataMode.EMBED).encode("utf-8")
+        ).hexdigest()
+        node.id_ = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{url}#{chunk_hash}"))
+        node.metadata["chunk_hash"] = chunk_hash
+        nodes[node.id_] = node
+    return list(nodes.values())
+
+
+def _load_existing_documents(client, collection_name: str) -> Dict[str, dict]:
+    """Map every URL in the collection to its document hash and point IDs."""
+    existing: Dict[str, dict] = {}
+    if not client.collection_exists(collection_name):
+        return existing
+
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name,
+            with_payload=["url", "doc_hash", "date_added"],
+            with_vectors=False,
+            limit=1000,
+            offset=offset,
+        )
+        for point in points:
+            payload = point.payload or {}
+            url = payload.get("url")
+            if not url:
+                continue
+            document = existing.setdefault(
+                url,
+                {"doc_hash": payload.get("doc_hash"), "date_added": payload.get("date_added"), "point_ids": set()},
+            )
+            document["point_ids"].add(str(point.id))
+        if offset is None:
+            return existing
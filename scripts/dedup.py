@@ -0,0 +1,221 @@
+"""Near-duplicate and boilerplate elimination before embedding.
+
+``BoilerplateStripper`` removes sentences and lines that repeat across many
+pages of the same site (navigation, footers, cookie notices). ``Deduplicator``
+then drops documents that are near-duplicates of an earlier one, using
+MinHash signatures with LSH banding, and chunks that are near-duplicates of
+an earlier chunk, using 64-bit SimHash with a pigeonhole block index. Both
+indexes only hold hashes, so memory stays small on large crawls.
+"""
+import hashlib
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set
+from urllib.parse import urlparse
+
+import numpy as np
+
+from constants import (
+    BOILERPLATE_MIN_DOCUMENTS,
+    BOILERPLATE_MIN_FRACTION,
+    DEDUP_CHUNK_MAX_DISTANCE,
+    DEDUP_DOCUMENT_THRESHOLD,
+    DEDUP_MINHASH_BANDS,
+    DEDUP_MINHASH_PERMUTATIONS,
+    DEDUP_SHINGLE_SIZE,
+)
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_SEGMENT_BOUNDARY = re.compile(r"\n+|(?<=[.!?])\s+")
+_WORD = re.compile(r"\w+")
+# SimHash blocks: two chunks within DEDUP_CHUNK_MAX_DISTANCE bits share at least one.
+_SIMHASH_BLOCKS = DEDUP_CHUNK_MAX_DISTANCE + 1
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def segments(text: str) -> List[str]:
+    return [segment for segment in _SEGMENT_BOUNDARY.split(text) if segment.strip()]
+
+
+def shingles(text: str, size: int = DEDUP_SHINGLE_SIZE) -> Set[str]:
+    words = _WORD.findall(text.casefold())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHash:
+    """MinHash signatures over word shingles, with fixed seeded permutations."""
+
+    def __init__(self, permutations: int = DEDUP_MINHASH_PERMUTATIONS, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, (1 << 61) - 1, size=permutations, dtype=np.uint64)
+        self.b = rng.randint(0, (1 << 61) - 1, size=permutations, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.array([_hash64(s) & 0xFFFFFFFF for s in shingles(text)], dtype=np.uint64)
+        if not hashes.size:
+            return np.full(len(self.a), _MAX_HASH, dtype=np.uint64)
+        permuted = np.bitwise_and((np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME, _MAX_HASH)
+        return permuted.min(axis=0)
+
+
+def simhash(text: str) -> int:
+    # Distinct word trigrams rather than word counts, so chunks that share a
+    # vocabulary but say different things (fee tables, city pages) stay apart.
+    tokens = shingles(text, 3)
+    if not tokens:
+        return 0
+    hashes = np.array([_hash64(token) for token in tokens], dtype=np.uint64)
+    bits = (hashes[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)
+    weights = (2 * bits.astype(np.int64) - 1).sum(axis=0)
+    return sum(1 << int(i) for i in np.flatnonzero(weights > 0))
+
+
+class BoilerplateStripper:
+    """Drops segments that occur on many pages of the same host.
+
+    A segment is boilerplate once it was seen on at least ``min_documents``
+    pages and on ``min_fraction`` of all pages of its host. Call ``learn`` on
+    every record first when the whole input is available; otherwise ``strip``
+    learns as it goes, and the first pages carrying a boilerplate segment
+    keep it.
+    """
+
+    def __init__(self, min_documents: int = BOILERPLATE_MIN_DOCUMENTS, min_fraction: float = BOILERPLATE_MIN_FRACTION):
+        self.min_documents = min_documents
+        self.min_fraction = min_fraction
+        self.segments_removed = 0
+        self.chars_removed = 0
+        self._counts: Dict[str, Counter] = defaultdict(Counter)
+        self._documents: Counter = Counter()
+        self._frozen = False
+
+    def learn(self, record: dict):
+        host = _host(record)
+        self._documents[host] += 1
+        self._counts[host].update({_hash64(_normalize(s)) for s in segments(record["text"])})
+
+    def learn_all(self, records: Iterable[dict]):
+        for record in records:
+            self.learn(record)
+        # strip() must not count these records a second time.
+        self._frozen = True
+
+    def strip(self, record: dict) -> dict:
+        if not self._frozen:
+            self.learn(record)
+        host = _host(record)
+        counts = self._counts[host]
+        threshold = max(self.min_documents, self.min_fraction * self._documents[host])
+        kept = []
+        for segment in segments(record["text"]):
+            if counts[_hash64(_normalize(segment))] >= threshold:
+                self.segments_removed += 1
+                self.chars_removed += len(segment)
+            else:
+                kept.append(segment)
+        return {**record, "text": " ".join(kept)}
+
+
+@dataclass
+class DedupStats:
+    documents_seen: int = 0
+    documents_dropped: int = 0
+    chunks_seen: int = 0
+    chunks_dropped: int = 0
+    # Chunks the dropped documents would have been split into.
+    chunks_avoided: int = 0
+
+    @property
+    def embeddings_saved(self) -> int:
+        return self.chunks_dropped + self.chunks_avoided
+
+
+class Deduplicator:
+    """Remembers kept documents and chunks and flags near-duplicates of them."""
+
+    def __init__(
+        self,
+        document_threshold: float = DEDUP_DOCUMENT_THRESHOLD,
+        bands: int = DEDUP_MINHASH_BANDS,
+        permutations: int = DEDUP_MINHASH_PERMUTATIONS,
+        chunk_max_distance: int = DEDUP_CHUNK_MAX_DISTANCE,
+        boilerplate: Optional[BoilerplateStripper] = None,
+    ):
+        if permutations % bands:
+            raise ValueError("permutations must be a multiple of bands")
+        self.document_threshold = document_threshold
+        self.bands = bands
+        self.rows = permutations // bands
+        self.chunk_max_distance = chunk_max_distance
+        self.boilerplate = boilerplate or BoilerplateStripper()
+        self.stats = DedupStats()
+        self._minhash = MinHash(permutations)
+        self._signatures: List[np.ndarray] = []
+        self._document_buckets: Dict[tuple, List[int]] = defaultdict(list)
+        self._chunk_buckets: Dict[tuple, List[int]] = defaultdict(list)
+
+    def is_duplicate_document(self, text: str) -> bool:
+        """True if ``text`` is a near-duplicate of a kept document; otherwise keep it."""
+        self.stats.documents_seen += 1
+        signature = self._minhash.signature(text)
+        bands = [(i, signature[i * self.rows:(i + 1) * self.rows].tobytes()) for i in range(self.bands)]
+        candidates = {index for band in bands for index in self._document_buckets.get(band, ())}
+        for index in candidates:
+            if np.mean(self._signatures[index] == signature) >= self.document_threshold:
+                self.stats.documents_dropped += 1
+                return True
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for band in bands:
+            self._document_buckets[band].append(index)
+        return False
+
+    def is_duplicate_chunk(self, text: str) -> bool:
+        """True if ``text`` is within ``chunk_max_distance`` bits of a kept chunk."""
+        self.stats.chunks_seen += 1
+        fingerprint = simhash(text)
+        blocks = _simhash_blocks(fingerprint)
+        for block in blocks:
+            for other in self._chunk_buckets.get(block, ()):
+                if bin(fingerprint ^ other).count("1") <= self.chunk_max_distance:
+                    self.stats.chunks_dropped += 1
+                    return True
+        for block in blocks:
+            self._chunk_buckets[block].append(fingerprint)
+        return False
+
+    def report(self, bytes_per_point: float = 0.0) -> dict:
+        return {
+            "documents_dropped": self.stats.documents_dropped,
+            "chunks_dropped": self.stats.chunks_dropped,
+            "embeddings_saved": self.stats.embeddings_saved,
+            "boilerplate_segments_removed": self.boilerplate.segments_removed,
+            "boilerplate_chars_removed": self.boilerplate.chars_removed,
+            "estimated_storage_saved_bytes": int(
+                self.stats.embeddings_saved * bytes_per_point + self.boilerplate.chars_removed
+            ),
+        }
+
+
+def _simhash_blocks(fingerprint: int) -> List[tuple]:
+    width = 64 // _SIMHASH_BLOCKS
+    blocks = []
+    for i in range(_SIMHASH_BLOCKS):
+        bits = 64 - i * width if i == _SIMHASH_BLOCKS - 1 else width
+        blocks.append((i, (fingerprint >> (i * width)) & ((1 << bits) - 1)))
+    return blocks
+
+
+def _normalize(segment: str) -> str:
+    return " ".join(_WORD.findall(segment.casefold()))
+
+
+def _host(record: dict) -> str:
+    return urlparse(record.get("metadata", {}).get("url") or "").netloc
@@ -0,0 +1,186 @@
+"""Concurrent, rate-limit-aware batch embedding for ingestion.
+
+``ParallelEmbedder`` keeps several embedding requests in flight at once. It
+throttles itself with a tokens-per-minute budget and an additive-increase /
+multiplicative-decrease concurrency limit: a 429 halves the number of parallel
+requests and backs off, while a run of successes slowly raises it again.
+Transient failures (5xx responses, timeouts, dropped connections) are retried
+with the same backoff but leave the concurrency limit alone.
+"""
+import asyncio
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+from constants import (
+    EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_MAX_RETRIES,
+    EMBEDDING_TOKENS_PER_MINUTE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(texts: List[str]) -> int:
+    # Roughly four characters per token for English text; good enough to pace
+    # requests against a tokens-per-minute quota.
+    return sum(len(text) // 4 + 1 for text in texts)
+
+
+# Raised by the OpenAI SDK when no response came back; matched by name so the
+# SDK stays an optional import here.
+_TRANSIENT_ERROR_NAMES = {"APIConnectionError", "APITimeoutError"}
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    return _status_code(error) == 429
+
+
+def is_transient_error(error: BaseException) -> bool:
+    status_code = _status_code(error)
+    if status_code is not None:
+        return status_code >= 500 or status_code == 408
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    return any(cls.__name__ in _TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Paces requests so that at most ``tokens_per_minute`` are spent per minute."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.tokens = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int):
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that shrinks on rate limits and grows back on success."""
+
+    def __init__(self, max_concurrency: int, success_streak: int = 4):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self.success_streak = success_streak
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, rate_limited: bool = False, failed: bool = False):
+        async with self._condition:
+            self.in_flight -= 1
+            if failed:
+                # Neither a success nor a sign of overload.
+                self._successes = 0
+            elif rate_limited:
+                self._successes = 0
+                self.limit = max(1, self.limit // 2)
+                logger.info(f"Rate limited, lowering embedding concurrency to {self.limit}")
+            else:
+                self._successes += 1
+                if self._successes >= self.success_streak and self.limit < self.max_concurrency:
+                    self._successes = 0
+                    self.limit += 1
+            self._condition.notify_all()
+
+
+class ParallelEmbedder:
+    """Runs embedding requests concurrently on a background event loop.
+
+    ``submit`` can be called from any thread and returns a future, which lets
+    the synchronous ingestion stages keep several batches in flight.
+    """
+
+    def __init__(
+        self,
+        embed_model,
+        max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+        tokens_per_minute: int = EMBEDDING_TOKENS_PER_MINUTE,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+    ):
+        self.embed_model = embed_model
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.rate_limited = 0
+        self.transient_errors = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="embedder", daemon=True)
+        self._thread.start()
+        self._limiter, self._bucket = self._call(self._create_controls())
+
+    async def _create_controls(self):
+        # Created on the background loop so their asyncio primitives bind to it.
+        return AdaptiveLimiter(self.max_concurrency), TokenBucket(self.tokens_per_minute)
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def submit(self, texts: List[str]) -> Future:
+        return asyncio.run_coroutine_threadsafe(self.aembed(texts), self._loop)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.submit(texts).result()
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        await self._bucket.acquire(estimate_tokens(texts))
+        for attempt in itertools.count():
+            await self._limiter.acquire()
+            try:
+                embeddings = await self.embed_model.aget_text_embedding_batch(texts)
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                if not (rate_limited or is_transient_error(e)) or attempt == self.max_retries:
+                    await self._limiter.release(failed=True)
+                    raise
+                if rate_limited:
+                    await self._limiter.release(rate_limited=True)
+                    self.rate_limited += 1
+                else:
+                    await self._limiter.release(failed=True)
+                    self.transient_errors += 1
+                    logger.warning(f"Embedding request failed ({e!r}), retrying")
+                delay = _retry_after(e) or min(60.0, 2 ** attempt) * (0.5 + random.random())
+                await asyncio.sleep(delay)
+            else:
+                await self._limiter.release()
+                return embeddings
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -1,17 +1,31 @@
-import os
 import re
+from datetime import datetime
 from urllib.parse import urljoin, urlparse
 
+import rootutils
 import scrapy
-from scrapy_playwright.page import PageMethod
+from scrapy import signals
 
+rootutils.setup_root(__file__, indicator=".project_root", pythonpath=True)
 
-class HandbookGermanySpider(scrapy.Spider):
+from scripts.crawl_frontier import (  # noqa: E402
+    CrawlFrontier,
+    content_hash,
+    is_unchanged,
+    unchanged_record,
+)
+from scripts.hybrid_fetch import HybridFetchMixin  # noqa: E402
+
+
+class HandbookGermanySpider(HybridFetchMixin, scrapy.Spider):
     name = "handbook-germany-spider"
     allowed_domains = ["handbookgermany.de"]
     start_urls = ["https://handbookgermany.de/en"]
 
-    visited_urls_file = "visited_urls.txt"
+    frontier_file = "handbook-germany.frontier.sqlite"
+    content_selector = ".layout-container"
+    # Pages known to need JavaScript are rendered right away.
+    playwright_url_patterns = []
 
     custom_settings = {
         "DEPTH_LIMIT": 2,
@@ -33,70 +47,74 @@ class HandbookGermanySpider(scrapy.Spider):
         "CONCURRENT_REQUESTS": 16,
         "CONCURRENT_REQUESTS_PER_DOMAIN": 8,
         "PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT": 30 * 1000,
+        # One {text, metadata} record per line, written as pages are parsed.
+        # Each crawl replaces the file, so it holds every page at most once.
         "FEEDS": {
-            "output.json": {
-                "format": "json",
+            "output.jsonl": {
+                "format": "jsonlines",
                 "encoding": "utf8",
                 "store_empty": False,
-                "fields": ["url", "title", "text_content"],
-                "indent": 4,
+                "overwrite": True,
+                "fields": ["text", "metadata"],
             },
         },
+        # Only active when INGESTION_COLLECTION is set.
+        "ITEM_PIPELINES": {
+            "scripts.crawl_pipelines.IngestionItemPipeline": 300,
+        },
         "REQUEST_FINGERPRINTER_IMPLEMENTATION": "2.7",
     }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.visited_urls = set()
+        self.frontier = CrawlFrontier(self.frontier_file)
+        self.logger.info(
+            f"Loaded {len(self.frontier)} known URLs from {self.frontier_file}"
+        )
+        self.unchanged_pages = 0
+        # -a refresh=true emits every page in full, e.g. after a failed ingestion.
+        self.refresh = str(getattr(self, "refresh", "")).lower() in ("1", "true", "yes")
 
-        if os.path.exists(self.visited_urls_file):
-            with open(self.visited_urls_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    url = line.strip()
-                    if url:
-                        self.visited_urls.add(url)
-            self.logger.info(
-                f"Loaded {len(self.visited_urls)} visited URLs from {self.visited_urls_file}"
-            )
-        else:
-            open(self.visited_urls_file, "a").close()
-            self.logger.info(
-                f"Created new visited URLs file at {self.visited_urls_file}"
-            )
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.item_scraped, signal=signals.item_scraped)
+        return spider
+
+    def item_scraped(self, item, response, spider):
+        # Only now is the page known to be handed off; dropped items are emitted again next time.
+        if not is_unchanged(item):
+            self.frontier.mark_emitted(item["metadata"]["url"])
 
     def start_requests(self):
         for url in self.start_urls:
-            if url not in self.visited_urls:
-                yield scrapy.Request(
-                    url,
-                    callback=self.parse,
-                    meta={
-                        "playwright": True,
-                        "playwright_page_methods": self.get_playwright_page_methods(),
-                    },
-                )
-            else:
-                self.logger.info(f"Skipping already visited URL: {url}")
-
-    def get_playwright_page_methods(self):
-        scroll_script = """
-        async () => {
-            let previousHeight = document.body.scrollHeight;
-            while (true) {
-                window.scrollTo(0, document.body.scrollHeight);
-                await new Promise(resolve => setTimeout(resolve, 1000));
-                let newHeight = document.body.scrollHeight;
-                if (newHeight === previousHeight){
-                    break;
-                }
-                previousHeight = newHeight;
-            }
-        }
-        """
-        return [PageMethod("evaluate", scroll_script)]
+            yield self.request_page(url)
+
+    def request_page(self, url: str):
+        # Known pages are requested conditionally; a 304 comes back to parse.
+        return self.make_request(
+            url,
+            headers={} if self.refresh else self.frontier.conditional_headers(url),
+            meta={"handle_httpstatus_list": [304]},
+        )
 
     def parse(self, response, **kwargs):
+        if response.status == 304:
+            self.logger.info(f"Not modified: {response.url}")
+            self.unchanged_pages += 1
+            self.frontier.touch(response.url, response.headers)
+            yield unchanged_record(response.url)
+            entry = self.frontier.get(response.url)
+            for url in entry.links if entry else []:
+                yield self.request_page(url)
+            return
+
+        fallback = self.render_fallback(response)
+        if fallback is not None:
+            yield fallback
+            return
+
         self.logger.info(f"Parsing URL: {response.url}")
 
         title = (
@@ -107,13 +125,11 @@ class HandbookGermanySpider(scrapy.Spider):
         if not title:
             self.logger.warning(f"No title found for URL: {response.url}")
 
-        MAIN_SELECTOR = ".layout-container"
-
-        text_content = response.css(".layout-container *::text").getall()
+        text_content = response.css(f"{self.content_selector} *::text").getall()
 
         if not text_content:
             self.logger.warning(
-                f"No text found within {MAIN_SELECTOR} for URL: {response.url}"
+                f"No text found within {self.content_selector} for URL: {response.url}"
             )
 
         cleaned_text = self.clean_text(text_content)
@@ -126,13 +142,24 @@ class HandbookGermanySpider(scrapy.Spider):
             )
             return
 
-        yield {
-            "url": response.url,
-            "title": title,
-            "text_content": cleaned_text,
-        }
-
-        self.mark_url_as_visited(response.url)
+        page_hash = content_hash(title or "", cleaned_text)
+        entry = self.frontier.get(response.url)
+        if self.refresh or entry is None or entry.content_hash != page_hash:
+            self.frontier.stage(response.url, response.headers, page_hash)
+            yield {
+                "text": cleaned_text,
+                "metadata": {
+                    "url": response.url,
+                    "title": title or "No Title",
+                    "source_type": "website",
+                    "date_added": datetime.now().isoformat(),
+                },
+            }
+        else:
+            self.unchanged_pages += 1
+            self.logger.info(f"Content unchanged: {response.url}")
+            self.frontier.touch(response.url, response.headers)
+            yield unchanged_record(response.url)
 
         raw_links = response.css('a[href^="/en/"]::attr(href)').getall()
         self.logger.info(f"Found {len(raw_links)} raw links.")
@@ -153,28 +180,23 @@ class HandbookGermanySpider(scrapy.Spider):
             f"Filtered down to {len(filtered_links)} links after exclusions."
         )
 
+        links = []
         for link in filtered_links:
             absolute_url = urljoin(response.url, link)
             parsed_url = urlparse(absolute_url)
             domain = parsed_url.netloc
 
             if domain.lower() in self.allowed_domains:
-                if absolute_url not in self.visited_urls:
-                    yield scrapy.Request(
-                        absolute_url,
-                        callback=self.parse,
-                        meta={
-                            "playwright": True,
-                            "playwright_page_methods": self.get_playwright_page_methods(),
-                        },
-                    )
-                else:
-                    self.logger.info(f"Skipping already visited URL: {absolute_url}")
+                links.append(absolute_url)
             else:
                 self.logger.debug(
                     f"Excluded URL due to domain mismatch: {absolute_url}"
                 )
 
+        self.frontier.record(response.url, links)
+        for url in links:
+            yield self.request_page(url)
+
     def contains_personal_info(self, text: str) -> bool:
         exclusion_term = "Fact Sheet"
 
@@ -191,15 +213,8 @@ class HandbookGermanySpider(scrapy.Spider):
         cleaned_text = cleaned_text.replace('"', '\\"')
         return cleaned_text
 
-    def mark_url_as_visited(self, url: str):
-        if url not in self.visited_urls:
-            self.visited_urls.add(url)
-            try:
-                with open(self.visited_urls_file, "a", encoding="utf-8") as f:
-                    f.write(f"{url}\n")
-                self.logger.debug(f"Marked URL as visited: {url}")
-            except Exception as e:
-                self.logger.error(f"Failed to mark URL as visited: {url}. Error: {e}")
-
     def closed(self, reason):
+        self.log_fetch_stats()
+        self.logger.info(f"{self.unchanged_pages} pages unchanged since the last crawl")
+        self.frontier.close()
         self.logger.info(f"Spider closed: {reason}")
@@ -0,0 +1,129 @@
+"""HTTP-first fetching for the Scrapy crawlers, with a headless browser fallback.
+
+Pages are requested over plain HTTP. Only URLs matching
+``playwright_url_patterns``, or pages with no text under ``content_selector``
+over HTTP, are fetched again through Playwright. The scroll wait used
+for rendered pages is event-driven and bounded: it stops as soon as the page
+stops growing, and never runs longer than ``CRAWL_SCROLL_TIMEOUT_MS``.
+"""
+import re
+import time
+from typing import Dict, List, Optional
+
+import scrapy
+from scrapy_playwright.page import PageMethod
+
+from constants import (
+    CRAWL_SCROLL_IDLE_MS,
+    CRAWL_SCROLL_MAX_STEPS,
+    CRAWL_SCROLL_TIMEOUT_MS,
+)
+
+HTTP_MODE = "http"
+PLAYWRIGHT_MODE = "playwright"
+
+# Scroll to the bottom, then wait until the DOM grows the page or ``idleMs``
+# passes without it growing; whichever comes first.
+SCROLL_SCRIPT = """
+async ({maxSteps, idleMs, timeoutMs}) => {
+    const deadline = Date.now() + timeoutMs;
+    for (let step = 0; step < maxSteps && Date.now() < deadline; step++) {
+        const previousHeight = document.body.scrollHeight;
+        window.scrollTo(0, previousHeight);
+        const grew = await new Promise(resolve => {
+            const observer = new MutationObserver(() => {
+                if (document.body.scrollHeight > previousHeight) {
+                    observer.disconnect();
+                    resolve(true);
+                }
+            });
+            observer.observe(document.body, {childList: true, subtree: true});
+            setTimeout(() => {
+                observer.disconnect();
+                resolve(document.body.scrollHeight > previousHeight);
+            }, Math.min(idleMs, Math.max(0, deadline - Date.now())));
+        });
+        if (!grew) {
+            break;
+        }
+    }
+}
+"""
+
+
+class HybridFetchMixin:
+    """Mixed into a ``scrapy.Spider`` that sets ``content_selector``.
+
+    ``parse`` should start with ``render_fallback``, and yield the request it
+    returns instead of parsing the page.
+    """
+
+    content_selector: str = ""
+    playwright_url_patterns: List[str] = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._playwright_patterns = [re.compile(p) for p in self.playwright_url_patterns]
+        self.fetch_stats: Dict[str, Dict[str, float]] = {
+            mode: {"pages": 0, "fallbacks": 0, "seconds": 0.0} for mode in (HTTP_MODE, PLAYWRIGHT_MODE)
+        }
+        self.crawl_started = time.monotonic()
+
+    def make_request(self, url: str, render: Optional[bool] = None, **kwargs) -> scrapy.Request:
+        if render is None:
+            render = any(p.search(url) for p in self._playwright_patterns)
+        meta = kwargs.pop("meta", {})
+        if render:
+            meta.update(
+                {
+                    "playwright": True,
+                    "playwright_page_methods": self.get_playwright_page_methods(),
+                }
+            )
+        return scrapy.Request(url, callback=self.parse, meta=meta, **kwargs)
+
+    def get_playwright_page_methods(self):
+        return [
+            PageMethod(
+                "evaluate",
+                SCROLL_SCRIPT,
+                {
+                    "maxSteps": CRAWL_SCROLL_MAX_STEPS,
+                    "idleMs": CRAWL_SCROLL_IDLE_MS,
+                    "timeoutMs": CRAWL_SCROLL_TIMEOUT_MS,
+                },
+            )
+        ]
+
+    def has_content(self, response) -> bool:
+        # JS-rendered pages often ship the container itself, just empty.
+        return bool("".join(response.css(f"{self.content_selector} ::text").getall()).strip())
+
+    def render_fallback(self, response) -> Optional[scrapy.Request]:
+        """Record the fetch; return a Playwright request if the page needs rendering."""
+        mode = PLAYWRIGHT_MODE if response.meta.get("playwright") else HTTP_MODE
+        stats = self.fetch_stats[mode]
+        stats["pages"] += 1
+        stats["seconds"] += response.meta.get("download_latency", 0.0)
+        self.crawler.stats.inc_value(f"hybrid_fetch/{mode}/pages")
+
+        if mode == PLAYWRIGHT_MODE or self.has_content(response):
+            return None
+        stats["fallbacks"] += 1
+        self.crawler.stats.inc_value("hybrid_fetch/http/fallbacks")
+        self.logger.info(f"No text in {self.content_selector} over HTTP, rendering: {response.url}")
+        return self.make_request(response.url, render=True, dont_filter=True)
+
+    def log_fetch_stats(self):
+        elapsed_minutes = max(time.monotonic() - self.crawl_started, 1e-9) / 60
+        for mode, stats in self.fetch_stats.items():
+            if not stats["pages"]:
+                continue
+            # Per download slot: how many pages one slot fetches per minute in this mode.
+            per_slot = stats["pages"] / (stats["seconds"] / 60) if stats["seconds"] else 0.0
+            self.logger.info(
+                f"{mode}: {stats['pages']:.0f} pages ({stats['fallbacks']:.0f} re-rendered), "
+                f"{stats['pages'] / elapsed_minutes:.1f} pages/min over the crawl, "
+                f"{per_slot:.1f} pages/min per download slot"
+            )
+            self.crawler.stats.set_value(f"hybrid_fetch/{mode}/pages_per_minute", round(per_slot, 1))
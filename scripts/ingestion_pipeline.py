@@ -0,0 +1,488 @@
+"""Streaming ingestion: reader -> splitter -> embedder -> Qdrant writer.
+
+Each stage runs in its own thread and hands work to the next one through a
+bounded queue, so memory stays flat no matter how large the crawl dump is and
+the first points are written while the file is still being read.
+
+Usage:
+    python scripts/ingestion_pipeline.py data.jsonl --collection study-in-germany [--incremental]
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import rootutils
+
+rootutils.setup_root(__file__, indicator=".project_root", pythonpath=True)
+
+from llama_index.core.schema import MetadataMode  # noqa: E402
+from llama_index.core.settings import Settings  # noqa: E402
+
+from config import ENVIRONMENT, QDRANT_API_KEY, QDRANT_URL  # noqa: E402
+from constants import DEDUP_ENABLED, INGESTION_BATCH_SIZE, INGESTION_QUEUE_SIZE  # noqa: E402
+from qdrant_client.http import models as rest  # noqa: E402
+
+from scripts.crawl_frontier import is_unchanged  # noqa: E402
+from scripts.data_preparation import (  # noqa: E402
+    IngestionDiff,
+    _configure_settings,
+    _create_chunk_nodes,
+    _create_text_splitter,
+    _document_hash,
+    _initialize_vector_store,
+    _load_existing_documents,
+)
+from scripts.dedup import Deduplicator  # noqa: E402
+from scripts.embedding_engine import ParallelEmbedder  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def iter_records(file_path: str, read_size: int = 1 << 16) -> Iterator[dict]:
+    """Yield records from a JSON Lines file or a JSON array without loading it whole."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        if head != "[":
+            first_line = head + f.readline()
+            for line in (first_line, *f):
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        decoder = json.JSONDecoder()
+        buffer = ""
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = f.read(read_size)
+                if not chunk:
+                    if buffer.strip():
+                        raise
+                    return
+                buffer += chunk
+                continue
+            yield record
+            buffer = buffer[end:]
+
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    busy_seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+
+@dataclass
+class _Batch:
+    nodes: list
+    last_record: int
+    embeddings: List[List[float]] = field(default_factory=list)
+    # Incremental mode: points of changed documents that are gone, and the
+    # new document hash for the points that are kept.
+    stale_ids: Set[str] = field(default_factory=set)
+    payloads: List[Tuple[str, List[str]]] = field(default_factory=list)
+
+
+def file_identity(file_path: str) -> dict:
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class Checkpoint:
+    """Remembers how many input records were fully written to Qdrant.
+
+    With a ``source`` (see ``file_identity``) the checkpoint only applies to
+    that exact input; one written for a different or since modified file is
+    ignored and removed.
+    """
+
+    def __init__(self, path: Optional[str], source: Optional[dict] = None):
+        self.path = path
+        self.source = source
+        self.records_done = 0
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("source") == source:
+                self.records_done = saved.get("records_done", 0)
+            else:
+                logger.warning(f"Checkpoint {path} was written for a different input, starting over")
+                self.clear()
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def save(self, records_done: int):
+        self.records_done = records_done
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"records_done": records_done, "source": self.source}, f)
+        os.replace(tmp_path, self.path)
+
+
+class IngestionPipeline:
+    """Runs the ingestion stages concurrently over a stream of records.
+
+    Chunk point IDs are deterministic, so replaying the batches after the last
+    checkpoint on resume overwrites the same points instead of duplicating them.
+    Up to ``embedder.max_concurrency`` batches are embedded at once while the
+    writer upserts the previous ones. With a ``dedup``, boilerplate is
+    stripped from each record and near-duplicate documents and chunks are
+    dropped before they are embedded.
+
+    With ``incremental=True`` records whose document hash matches the stored
+    one are skipped, and the stale points of changed documents are deleted
+    once their new chunks are written, as ``store_in_qdrant`` does. URLs
+    missing from the input are not pruned. Unchanged-page markers from the
+    crawlers are always skipped.
+    """
+
+    def __init__(
+        self,
+        client,
+        collection_name: str,
+        checkpoint_path: Optional[str] = None,
+        checkpoint_source: Optional[dict] = None,
+        batch_size: int = INGESTION_BATCH_SIZE,
+        queue_size: int = INGESTION_QUEUE_SIZE,
+        embedder: Optional[ParallelEmbedder] = None,
+        dedup: Optional[Deduplicator] = None,
+        incremental: bool = False,
+    ):
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.checkpoint = Checkpoint(checkpoint_path, checkpoint_source)
+        self.embedder = embedder or ParallelEmbedder(Settings.embed_model)
+        self.dedup = dedup
+        self.incremental = incremental
+        self.diff = IngestionDiff()
+        self._existing: Dict[str, dict] = {}
+        self.points_written = 0
+        self.bytes_written = 0
+        self.stats = {name: StageStats(name) for name in ("read", "split", "embed", "write")}
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+    def run(self, records: Iterable[dict]) -> dict:
+        vector_store = _initialize_vector_store(self.client, self.collection_name)
+        if self.incremental:
+            self._existing = _load_existing_documents(self.client, self.collection_name)
+        splitter = _create_text_splitter()
+        documents = queue.Queue(self.queue_size)
+        batches = queue.Queue(self.queue_size)
+        embedded = queue.Queue(self.queue_size)
+
+        threads = [
+            threading.Thread(target=self._guard, args=(self._read, documents, records), name="read"),
+            threading.Thread(target=self._guard, args=(self._split, batches, splitter, documents), name="split"),
+            threading.Thread(target=self._guard, args=(self._embed, embedded, batches), name="embed"),
+            threading.Thread(target=self._guard, args=(self._write, None, vector_store, embedded), name="write"),
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+        report = self.report(time.perf_counter() - started)
+        self.checkpoint.clear()
+        logger.info(f"Ingestion finished: {report}")
+        return report
+
+    def report(self, elapsed: float) -> dict:
+        report = {
+            "elapsed_seconds": round(elapsed, 3),
+            "records_done": self.checkpoint.records_done,
+            "stages": {
+                stats.name: {"items": stats.items, "items_per_second": round(stats.throughput, 2)}
+                for stats in self.stats.values()
+            },
+        }
+        if self.incremental:
+            report["changes"] = asdict(self.diff)
+        if self.dedup is not None:
+            bytes_per_point = self.bytes_written / self.points_written if self.points_written else 0.0
+            report["dedup"] = self.dedup.report(bytes_per_point)
+        return report
+
+    def _guard(self, stage, output: Optional[queue.Queue], *args):
+        try:
+            if output is not None:
+                stage(*args, output)
+            else:
+                stage(*args)
+        except BaseException as e:
+            logger.error(f"Ingestion stage {threading.current_thread().name} failed: {e}", exc_info=True)
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            # Always tell the next stage that no more input is coming.
+            if output is not None:
+                self._put(output, _DONE, force=True)
+
+    def _put(self, target: queue.Queue, item, force: bool = False):
+        while not self._stop.is_set() or force:
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if force and self._stop.is_set():
+                    return
+
+    def _items(self, source: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                item = source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+    def _read(self, records: Iterable[dict], documents: queue.Queue):
+        stats = self.stats["read"]
+        skip = self.checkpoint.records_done
+        if skip:
+            logger.info(f"Resuming after {skip} records")
+        started = time.perf_counter()
+        for index, record in enumerate(records):
+            if self._stop.is_set():
+                return
+            if index < skip:
+                continue
+            stats.busy_seconds += time.perf_counter() - started
+            self._put(documents, (index, record))
+            stats.items += 1
+            started = time.perf_counter()
+
+    def _split(self, splitter, documents: queue.Queue, batches: queue.Queue):
+        stats = self.stats["split"]
+        pending = _Batch(nodes=[], last_record=-1)
+        for index, record in self._items(documents):
+            started = time.perf_counter()
+            pending.last_record = index
+            if is_unchanged(record):
+                self.diff.documents_unchanged += 1
+            elif self.incremental:
+                self._split_incrementally(splitter, record, pending)
+            else:
+                pending.nodes.extend(self._record_nodes(splitter, record, dict(record["metadata"])))
+            stats.items += 1
+            stats.busy_seconds += time.perf_counter() - started
+            # Batches end on record boundaries so the checkpoint never lands
+            # in the middle of a document.
+            if len(pending.nodes) >= self.batch_size:
+                self._put(batches, pending)
+                pending = _Batch(nodes=[], last_record=index)
+        if pending.nodes or pending.stale_ids or pending.payloads:
+            self._put(batches, pending)
+
+    def _record_nodes(self, splitter, record: dict, metadata: dict) -> list:
+        if self.dedup is not None:
+            return self._dedup_nodes(splitter, record, metadata)
+        return _create_chunk_nodes(splitter, metadata["url"], record["text"], metadata)
+
+    def _split_incrementally(self, splitter, record: dict, batch: _Batch):
+        url = record["metadata"]["url"]
+        doc_hash = _document_hash(record)
+        previous = self._existing.get(url)
+        if previous and previous["doc_hash"] == doc_hash:
+            self.diff.documents_unchanged += 1
+            return
+
+        metadata = dict(record["metadata"])
+        if previous and previous.get("date_added"):
+            metadata["date_added"] = previous["date_added"]
+        metadata.setdefault("date_added", datetime.now().isoformat())
+        metadata["doc_hash"] = doc_hash
+
+        nodes = self._record_nodes(splitter, record, metadata)
+        old_ids = previous["point_ids"] if previous else set()
+        node_ids = {node.node_id for node in nodes}
+        new_nodes = [node for node in nodes if node.node_id not in old_ids]
+        stale_ids = old_ids - node_ids
+        kept_ids = old_ids - stale_ids
+
+        batch.nodes.extend(new_nodes)
+        batch.stale_ids |= stale_ids
+        if kept_ids:
+            batch.payloads.append((doc_hash, list(kept_ids)))
+        # A URL seen again later in the stream is compared with this version.
+        self._existing[url] = {"doc_hash": doc_hash, "date_added": metadata["date_added"], "point_ids": node_ids}
+
+        self.diff.chunks_upserted += len(new_nodes)
+        self.diff.chunks_deleted += len(stale_ids)
+        if previous:
+            self.diff.documents_updated += 1
+        else:
+            self.diff.documents_added += 1
+
+    def _dedup_nodes(self, splitter, record: dict, metadata: dict) -> list:
+        text = self.dedup.boilerplate.strip(record)["text"]
+        if not text.strip():
+            # Nothing but boilerplate.
+            self.dedup.stats.documents_dropped += 1
+        elif not self.dedup.is_duplicate_document(text):
+            nodes = _create_chunk_nodes(splitter, metadata["url"], text, metadata)
+            return [node for node in nodes if not self.dedup.is_duplicate_chunk(node.text)]
+        # Split anyway, only to count the embeddings this saved.
+        self.dedup.stats.chunks_avoided += len(
+            _create_chunk_nodes(splitter, metadata["url"], record["text"], metadata)
+        )
+        return []
+
+    def _embed(self, batches: queue.Queue, embedded: queue.Queue):
+        stats = self.stats["embed"]
+        in_flight: deque = deque()
+
+        def finish_oldest():
+            batch, future, started = in_flight.popleft()
+            batch.embeddings = future.result()
+            stats.items += len(batch.nodes)
+            stats.busy_seconds += time.perf_counter() - started
+            self._put(embedded, batch)
+
+        # Batches are handed on in input order so checkpoints stay monotonic.
+        for batch in self._items(batches):
+            texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch.nodes]
+            if texts:
+                future = self.embedder.submit(texts)
+            else:
+                # Only deletions and payload updates; nothing to embed.
+                future = Future()
+                future.set_result([])
+            in_flight.append((batch, future, time.perf_counter()))
+            while len(in_flight) >= self.embedder.max_concurrency or (in_flight and in_flight[0][1].done()):
+                finish_oldest()
+        while in_flight and not self._stop.is_set():
+            finish_oldest()
+
+    def _write(self, vector_store, embedded: queue.Queue):
+        stats = self.stats["write"]
+        for batch in self._items(embedded):
+            started = time.perf_counter()
+            for node, embedding in zip(batch.nodes, batch.embeddings):
+                node.embedding = embedding
+            if batch.nodes:
+                vector_store.add(batch.nodes)
+            # Old points go only after the new ones are in, so a crash never leaves a page without chunks.
+            for doc_hash, point_ids in batch.payloads:
+                self.client.set_payload(self.collection_name, payload={"doc_hash": doc_hash}, points=point_ids)
+            if batch.stale_ids:
+                self.client.delete(
+                    self.collection_name, points_selector=rest.PointIdsList(points=list(batch.stale_ids))
+                )
+            self.checkpoint.save(batch.last_record + 1)
+            self.points_written += len(batch.nodes)
+            self.bytes_written += sum(4 * len(node.embedding) + len(node.text.encode("utf-8")) for node in batch.nodes)
+            stats.items += len(batch.nodes)
+            stats.busy_seconds += time.perf_counter() - started
+
+
+def ingest_records(
+    client,
+    collection_name: str,
+    records: Iterable[dict],
+    checkpoint_path: Optional[str] = None,
+    dedup: Union[bool, Deduplicator] = DEDUP_ENABLED,
+    incremental: bool = False,
+    checkpoint_source: Optional[dict] = None,
+) -> dict:
+    """Ingest ``{text, metadata}`` records; ``records`` may still be growing, e.g. during a crawl."""
+    # Retries are left to the ParallelEmbedder, which backs off on 429s and transient errors.
+    _configure_settings(max_retries=0)
+    embedder = ParallelEmbedder(Settings.embed_model)
+    if dedup is True:
+        dedup = Deduplicator()
+    try:
+        pipeline = IngestionPipeline(
+            client,
+            collection_name,
+            checkpoint_path=checkpoint_path,
+            checkpoint_source=checkpoint_source,
+            embedder=embedder,
+            dedup=dedup or None,
+            incremental=incremental,
+        )
+        return pipeline.run(records)
+    finally:
+        embedder.close()
+
+
+def ingest_file(
+    client,
+    collection_name: str,
+    file_path: str,
+    checkpoint_path: Optional[str] = None,
+    dedup: bool = DEDUP_ENABLED,
+    incremental: bool = False,
+) -> dict:
+    deduplicator = False
+    if dedup:
+        deduplicator = Deduplicator()
+        # The whole file is available, so boilerplate is learned from every page up front.
+        deduplicator.boilerplate.learn_all(r for r in iter_records(file_path) if not is_unchanged(r))
+    return ingest_records(
+        client,
+        collection_name,
+        iter_records(file_path),
+        checkpoint_path,
+        deduplicator,
+        incremental=incremental,
+        checkpoint_source=file_identity(file_path),
+    )
+
+
+def main():
+    from app.utils.storage_utils import initialize_qdrant_client, mark_collection_ingested
+
+    parser = argparse.ArgumentParser(description="Stream a crawl dump into Qdrant.")
+    parser.add_argument("file_path", help="JSON Lines file or JSON array of {text, metadata} records")
+    parser.add_argument("--collection", default="study-in-germany")
+    parser.add_argument("--checkpoint", help="Checkpoint file used to resume after a crash")
+    parser.add_argument("--no-dedup", action="store_true", help="Embed boilerplate and near-duplicates too")
+    parser.add_argument(
+        "--incremental", action="store_true", help="Skip unchanged pages and replace the chunks of changed ones"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    client = initialize_qdrant_client(QDRANT_URL, QDRANT_API_KEY, ENVIRONMENT)
+    checkpoint_path = args.checkpoint or f"{args.file_path}.checkpoint"
+    report = ingest_file(
+        client, args.collection, args.file_path, checkpoint_path, dedup=not args.no_dedup, incremental=args.incremental
+    )
+    mark_collection_ingested(client, args.collection)
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""Removes personal information from crawled records before ingestion.
+
+Emails, phone numbers and street addresses are masked with precompiled
+regular expressions, person names and locations with spaCy NER. Texts are
+sent through ``nlp.pipe`` in batches on a pool of worker processes, each
+running only the NER component. Results are cached by content hash, so pages
+that did not change since the last crawl are not processed again.
+
+Usage:
+    python scripts/pii_cleaning.py temporary_folder/output.jsonl temporary_folder/output_cleaned.jsonl
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import rootutils
+
+rootutils.setup_root(__file__, indicator=".project_root", pythonpath=True)
+
+from config import CLEANING_CACHE_PATH  # noqa: E402
+from constants import CLEANING_BATCH_SIZE, CLEANING_SPACY_MODEL  # noqa: E402
+from scripts.crawl_frontier import is_unchanged  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Bump when the patterns or placeholders change, so cached results are redone.
+CLEANER_VERSION = 1
+
+EMAIL_PATTERN = re.compile(r"\S+@\S+")
+PHONE_PATTERN = re.compile(r"\+?\d[\d -]{8,}\d")
+ADDRESS_PATTERN = re.compile(
+    r"\d{1,5}\s\w+\s(?:Street|St|Avenue|Ave|Boulevard|Blvd|Road|Rd|Lane|Ln|Drive|Dr)\b[\w\s,.-]*"
+)
+ENTITY_PLACEHOLDERS = {"PERSON": "[NAME]", "GPE": "[LOCATION]", "LOC": "[LOCATION]"}
+
+_nlp = None
+
+
+def load_nlp(model_name: str = CLEANING_SPACY_MODEL):
+    import spacy
+
+    # Tagger, parser and lemmatizer are not needed to find entities.
+    return spacy.load(model_name, enable=["ner"])
+
+
+def mask_patterns(text: str) -> str:
+    text = EMAIL_PATTERN.sub("[EMAIL]", text)
+    text = PHONE_PATTERN.sub("[PHONE]", text)
+    return ADDRESS_PATTERN.sub("[ADDRESS]", text)
+
+
+def mask_entities(text: str, doc) -> str:
+    parts = []
+    last = 0
+    for ent in doc.ents:
+        placeholder = ENTITY_PLACEHOLDERS.get(ent.label_)
+        if placeholder is None:
+            continue
+        parts.append(text[last:ent.start_char])
+        parts.append(placeholder)
+        last = ent.end_char
+    parts.append(text[last:])
+    return "".join(parts)
+
+
+def clean_texts(texts: Sequence[str], nlp=None, batch_size: int = CLEANING_BATCH_SIZE) -> List[str]:
+    """Mask personal information in ``texts``; uses the worker's model if ``nlp`` is not given."""
+    nlp = nlp or _nlp
+    masked = [mask_patterns(text) for text in texts]
+    return [mask_entities(text, doc) for text, doc in zip(masked, nlp.pipe(masked, batch_size=batch_size))]
+
+
+def remove_personal_info(text: str, nlp=None) -> str:
+    global _nlp
+    if nlp is None and _nlp is None:
+        _nlp = load_nlp()
+    return clean_texts([text], nlp)[0]
+
+
+def _init_worker(model_name: str):
+    global _nlp
+    _nlp = load_nlp(model_name)
+
+
+class CleaningCache:
+    """Cleaned texts in a SQLite file, keyed by a hash of the raw text."""
+
+    def __init__(self, path: Optional[str], model_name: str):
+        self.model_name = model_name
+        self.hits = 0
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path)
+            self._db.execute("CREATE TABLE IF NOT EXISTS cleaned (key TEXT PRIMARY KEY, text TEXT NOT NULL)")
+            self._db.commit()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{CLEANER_VERSION}\0{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, str]:
+        if self._db is None or not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        found = dict(
+            self._db.execute(f"SELECT key, text FROM cleaned WHERE key IN ({placeholders})", list(keys)).fetchall()
+        )
+        self.hits += len(found)
+        return found
+
+    def put_many(self, items: Dict[str, str]):
+        if self._db is None or not items:
+            return
+        self._db.executemany("INSERT OR REPLACE INTO cleaned (key, text) VALUES (?, ?)", list(items.items()))
+        self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+@dataclass
+class CleaningStats:
+    records: int = 0
+    unchanged: int = 0
+    duplicates: int = 0
+    empty: int = 0
+    cache_hits: int = 0
+    cleaned: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def records_per_second(self) -> float:
+        return self.records / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+@dataclass
+class _Batch:
+    records: List[dict]
+    keys: List[Optional[str]]
+    found: Dict[str, str]
+    future: Optional[Future] = None
+
+
+class PIICleaner:
+    """Cleans a stream of ``{text, metadata}`` records, keeping their order.
+
+    Records without a URL or text, or with a URL seen before, are dropped,
+    and missing titles are set to "No Title". Unchanged-page markers from the
+    crawlers are passed through as they are. Up to two batches per worker
+    are in flight at once, so memory stays bounded on inputs of any size.
+    With ``workers=0`` batches are cleaned in this process.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        batch_size: int = CLEANING_BATCH_SIZE,
+        model_name: str = CLEANING_SPACY_MODEL,
+        cache_path: Optional[str] = CLEANING_CACHE_PATH,
+    ):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.batch_size = batch_size
+        self.model_name = model_name
+        self.cache = CleaningCache(cache_path, model_name)
+        self.stats = CleaningStats()
+        self._nlp = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        if self.workers > 0:
+            self._pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(model_name,))
+        else:
+            self._nlp = load_nlp(model_name)
+
+    def clean_records(self, records: Iterable[dict]) -> Iterator[dict]:
+        started = time.perf_counter()
+        seen = set()
+        in_flight: deque = deque()
+        pending: List[dict] = []
+        try:
+            for record in records:
+                url = _url(record)
+                if url and is_unchanged(record):
+                    self.stats.unchanged += 1
+                elif not url or not (record.get("text") or "").strip():
+                    self.stats.empty += 1
+                    continue
+                if url in seen:
+                    self.stats.duplicates += 1
+                    continue
+                seen.add(url)
+                pending.append(record)
+                if len(pending) >= self.batch_size:
+                    in_flight.append(self._submit(pending))
+                    pending = []
+                while len(in_flight) > 2 * max(self.workers, 1) or (in_flight and _ready(in_flight[0])):
+                    yield from self._finish(in_flight.popleft())
+            if pending:
+                in_flight.append(self._submit(pending))
+            while in_flight:
+                yield from self._finish(in_flight.popleft())
+        finally:
+            for batch in in_flight:
+                if batch.future is not None:
+                    batch.future.cancel()
+            self.stats.elapsed_seconds += time.perf_counter() - started
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        self.cache.close()
+
+    def _submit(self, records: List[dict]) -> _Batch:
+        keys = [None if is_unchanged(record) else self.cache.key(record["text"]) for record in records]
+        found = self.cache.get_many([key for key in keys if key is not None])
+        batch = _Batch(records=records, keys=keys, found=found)
+        missing = [record["text"] for record, key in zip(records, keys) if key is not None and key not in found]
+        if missing:
+            if self._pool is not None:
+                batch.future = self._pool.submit(clean_texts, missing, None, self.batch_size)
+            else:
+                batch.future = Future()
+                batch.future.set_result(clean_texts(missing, self._nlp, self.batch_size))
+        return batch
+
+    def _finish(self, batch: _Batch) -> Iterator[dict]:
+        cleaned = iter(batch.future.result() if batch.future is not None else [])
+        fresh = {}
+        for record, key in zip(batch.records, batch.keys):
+            if key is None:
+                yield record
+                continue
+            if key in batch.found:
+                text = batch.found[key]
+                self.stats.cache_hits += 1
+            else:
+                text = fresh[key] = next(cleaned)
+                self.stats.cleaned += 1
+            self.stats.records += 1
+            metadata = dict(record.get("metadata", {}))
+            metadata["title"] = metadata.get("title") or "No Title"
+            yield {"text": text, "metadata": metadata}
+        self.cache.put_many(fresh)
+
+
+def _ready(batch: _Batch) -> bool:
+    return batch.future is None or batch.future.done()
+
+
+def _url(record: dict) -> Optional[str]:
+    return record.get("metadata", {}).get("url")
+
+
+def clean_file(input_path: str, output_path: str, **kwargs) -> CleaningStats:
+    """Clean a JSON Lines (or JSON array) file of records into a JSON Lines file.
+
+    The crawlers replace their feed on every crawl, but a file that several
+    crawls were appended to also works: only the last record of each URL,
+    the most recent version of the page, is kept.
+    """
+    from scripts.ingestion_pipeline import iter_records
+
+    last_index: Dict[str, int] = {}
+    total = 0
+    for index, record in enumerate(iter_records(input_path)):
+        last_index[_url(record)] = index
+        total += 1
+    latest = (
+        record for index, record in enumerate(iter_records(input_path)) if last_index.get(_url(record)) == index
+    )
+    cleaner = PIICleaner(**kwargs)
+    cleaner.stats.duplicates = total - len(last_index)
+    try:
+        with open(output_path, "w", encoding="utf-8") as f:
+            for record in cleaner.clean_records(latest):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        cleaner.close()
+    logger.info(f"Cleaned {input_path} into {output_path}: {cleaner.stats}")
+    return cleaner.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove personal information from crawled records.")
+    parser.add_argument("input_path", help="JSON Lines file or JSON array of {text, metadata} records")
+    parser.add_argument("output_path", help="JSON Lines file to write the cleaned records to")
+    parser.add_argument("--workers", type=int, help="Worker processes; 0 cleans in this process")
+    parser.add_argument("--batch-size", type=int, default=CLEANING_BATCH_SIZE)
+    parser.add_argument("--model", default=CLEANING_SPACY_MODEL, help="spaCy model with an NER component")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the cleaning cache")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stats = clean_file(
+        args.input_path,
+        args.output_path,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        model_name=args.model,
+        cache_path=None if args.no_cache else CLEANING_CACHE_PATH,
+    )
+    print(json.dumps({**asdict(stats), "records_per_second": round(stats.records_per_second, 1)}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
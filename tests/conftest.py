@@ -0,0 +1,8 @@
+import os
+
+import rootutils
+
+rootutils.setup_root(__file__, indicator=".project_root", pythonpath=True)
+
+# Clients are created at import time in a few modules; nothing is sent.
+os.environ.setdefault("OPENAI_API_KEY", "test")
@@ -0,0 +1,148 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils.admission import AdmissionController, AdmissionRejected, client_identifier
+
+
+def test_requests_over_the_client_cap_get_a_429():
+    async def scenario():
+        controller = AdmissionController(global_limit=10, per_client_limit=2)
+        tickets = [await controller.admit("a"), await controller.admit("a")]
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.admit("a")
+        other = await controller.admit("b")
+        return controller, tickets + [other], rejected.value
+
+    controller, tickets, rejection = asyncio.run(scenario())
+    assert rejection.status_code == 429
+    assert rejection.retry_after >= 1
+    assert controller.client_rejections == 1
+    for ticket in tickets:
+        ticket.release()
+    assert controller.snapshot()["active_clients"] == 0
+
+
+def test_queued_request_times_out_with_a_503():
+    async def scenario():
+        controller = AdmissionController(global_limit=1, per_client_limit=5, queue_timeout=0.05)
+        holder = await controller.admit("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.admit("b")
+        return controller, holder, rejected.value
+
+    controller, holder, rejection = asyncio.run(scenario())
+    assert rejection.status_code == 503
+    assert "Timed out" in rejection.detail
+    assert controller.global_slots.shed == 1
+    assert controller.global_slots.queued == 0
+    # The timed-out client gave its client slot back.
+    assert controller.snapshot()["active_clients"] == 1
+    holder.release()
+    assert controller.global_slots.in_flight == 0
+
+
+def test_freed_slot_goes_to_the_oldest_waiter():
+    async def scenario():
+        controller = AdmissionController(global_limit=1, per_client_limit=5, queue_timeout=1)
+        holder = await controller.admit("a")
+        waiter = asyncio.create_task(controller.admit("b"))
+        await asyncio.sleep(0.01)
+        holder.release()
+        ticket = await waiter
+        return controller, ticket
+
+    controller, ticket = asyncio.run(scenario())
+    assert controller.global_slots.in_flight == 1
+    ticket.release()
+    assert controller.global_slots.in_flight == 0
+
+
+def test_retry_after_follows_the_observed_hold_time():
+    async def scenario():
+        controller = AdmissionController(global_limit=1, per_client_limit=5, queue_size=0, queue_timeout=1)
+        # As if earlier requests held their slot for 4.2 s on average.
+        controller.global_slots.hold_seconds = 4.2
+        holder = await controller.admit("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.admit("b")
+        holder.release()
+        return rejected.value
+
+    rejection = asyncio.run(scenario())
+    assert rejection.status_code == 503
+    assert rejection.retry_after == 5
+
+
+def test_rejections_carry_a_retry_after_header():
+    from main import _rejection_response
+
+    response = _rejection_response(AdmissionRejected(429, 3, "Too many concurrent requests from this client"))
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+
+
+def test_forwarded_for_is_only_trusted_from_configured_proxies():
+    def request(peer, forwarded):
+        return SimpleNamespace(client=SimpleNamespace(host=peer), headers={"x-forwarded-for": forwarded})
+
+    assert client_identifier(request("203.0.113.9", "198.51.100.1"), trusted_proxies=[]) == "203.0.113.9"
+    assert client_identifier(request("10.0.0.1", "198.51.100.1, 10.0.0.2"), ["10.0.0.1", "10.0.0.2"]) == "198.51.100.1"
+
+
+def _router_scenario(monkeypatch, is_germany_related, germany_lane_taken):
+    from app.utils import router
+
+    retrievals = []
+
+    async def fake_retrieval(**kwargs):
+        retrievals.append(kwargs["query"])
+        await asyncio.sleep(10)
+
+    async def handler(*args, **kwargs):
+        return {"lanes": {name: lane.in_flight for name, lane in controller.lanes.items()}}
+
+    monkeypatch.setattr(router, "SPECULATIVE_RETRIEVAL", True)
+    monkeypatch.setattr(router, "aquery_qdrant", fake_retrieval)
+    controller = AdmissionController(
+        global_limit=5, per_client_limit=5, lane_limits={"germany": 1, "general": 1}, queue_timeout=0.05
+    )
+
+    async def scenario():
+        if germany_lane_taken:
+            other = await controller.admit("b")
+            await other.enter_lane("germany")
+        ticket = await controller.admit("a")
+        central = router.CentralController(
+            client=object(),
+            classifier=SimpleNamespace(predict=lambda query: is_germany_related),
+            admission_ticket=ticket,
+        )
+        central._handle_general_query = handler
+        central._handle_germany_query = handler
+        result = await central._route_query(None, [], "query")
+        await asyncio.sleep(0)
+        return result
+
+    return asyncio.run(scenario()), retrievals
+
+
+def test_speculative_retrieval_holds_a_germany_lane_slot(monkeypatch):
+    result, retrievals = _router_scenario(monkeypatch, is_germany_related=True, germany_lane_taken=False)
+    assert retrievals == ["query"]
+    assert result["lanes"] == {"germany": 1, "general": 0}
+
+
+def test_general_query_gives_the_speculative_slot_back(monkeypatch):
+    result, retrievals = _router_scenario(monkeypatch, is_germany_related=False, germany_lane_taken=False)
+    assert result["lanes"] == {"germany": 0, "general": 1}
+
+
+def test_no_speculation_when_the_germany_lane_is_full(monkeypatch):
+    result, retrievals = _router_scenario(monkeypatch, is_germany_related=False, germany_lane_taken=True)
+    assert retrievals == []
+    assert result["lanes"] == {"germany": 1, "general": 1}
+
+    with pytest.raises(AdmissionRejected):
+        _router_scenario(monkeypatch, is_germany_related=True, germany_lane_taken=True)
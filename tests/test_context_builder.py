@@ -0,0 +1,84 @@
+import asyncio
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from app.utils.context_builder import ContextBuilder
+from app.utils.sparse_index import BM25Index, HybridRetriever
+
+
+class _DenseRetriever(BaseRetriever):
+    def __init__(self, results):
+        super().__init__()
+        self.results = results
+
+    def _retrieve(self, query_bundle):
+        return list(self.results)
+
+
+def _node(text, url="https://example.de/visa", start=None, end=None):
+    return TextNode(text=text, metadata={"url": url}, start_char_idx=start, end_char_idx=end)
+
+
+def _hybrid(chunks, dense_scores):
+    sparse_index = BM25Index()
+    for chunk in chunks:
+        sparse_index.add(chunk)
+    dense = _DenseRetriever([NodeWithScore(node=c, score=s) for c, s in zip(chunks, dense_scores)])
+    return HybridRetriever(dense, sparse_index, similarity_cutoff=0.78)
+
+
+def test_off_topic_query_sharing_a_keyword_gets_no_context():
+    chunks = [
+        _node("The German student visa requires proof of a blocked account (Sperrkonto)."),
+        _node("Enrolment at a German university needs a health insurance certificate.", url="https://example.de/uni"),
+    ]
+    retriever = _hybrid(chunks, [0.61, 0.55])
+    nodes = asyncio.run(retriever.aretrieve(QueryBundle("how do I apply for a US student visa")))
+    assert nodes == []
+    assert ContextBuilder(similarity_cutoff=None).build(nodes)["context"] == ""
+
+
+def test_keyword_hits_are_kept_when_dense_similarity_clears_the_cutoff():
+    chunks = [
+        _node("Open a Sperrkonto before you apply for the German student visa."),
+        _node("Public transport tickets for students are cheap.", url="https://example.de/transport"),
+    ]
+    retriever = _hybrid(chunks, [0.83, 0.79])
+    nodes = retriever.retrieve(QueryBundle("Sperrkonto for the student visa"))
+    assert [n.node.node_id for n in nodes] == [chunks[0].node_id, chunks[1].node_id]
+
+
+def test_context_is_capped_at_max_sources_and_savings_never_negative():
+    nodes = [
+        NodeWithScore(node=_node(f"Chunk number {i} about topic {i}.", url=f"https://example.de/{i}"), score=0.9)
+        for i in range(8)
+    ]
+    builder = ContextBuilder(similarity_cutoff=None, max_sources=3)
+    report = builder.build(nodes)["context_report"]
+    assert report["used"] == 3
+    assert report["tokens_saved"] == report["baseline_tokens"] - report["context_tokens"] == 0
+
+
+def test_neighbouring_chunks_are_kept_and_repeated_spans_dropped():
+    text = "Students from outside the EU need a residence permit to stay longer than ninety days."
+    nodes = [
+        NodeWithScore(node=_node(text, start=0, end=100), score=0.9),
+        # Shares only the splitter overlap with the first chunk.
+        NodeWithScore(node=_node("The permit is issued by the local foreigners office.", start=90, end=190), score=0.85),
+        # The same span ingested again under another chunk id.
+        NodeWithScore(node=_node(text + " ", start=5, end=100), score=0.8),
+    ]
+    report = ContextBuilder(similarity_cutoff=None).build(nodes)["context_report"]
+    assert report["used"] == 2 and report["overlapping"] == 1
+
+
+def test_shingles_tell_rewording_from_repetition_without_spans():
+    text = "You can work 140 full days or 280 half days a year as an international student."
+    nodes = [
+        NodeWithScore(node=_node(text), score=0.9),
+        NodeWithScore(node=_node("International students may work part time; days a year are limited."), score=0.85),
+        NodeWithScore(node=_node("Note: " + text), score=0.8),
+    ]
+    report = ContextBuilder(similarity_cutoff=None).build(nodes)["context_report"]
+    assert report["used"] == 2 and report["overlapping"] == 1
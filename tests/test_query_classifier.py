@@ -0,0 +1,32 @@
+import pytest
+
+from app.utils.query_classifier import get_query_classifier
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "how do I apply for a US student visa",
+        "student visa for Canada",
+        "Can I get a scholarship for a master's in Australia?",
+        "What are the tuition fees at Harvard for international students?",
+    ],
+)
+def test_other_destinations_are_off_topic(query):
+    assert get_query_classifier("cascade").predict(query) is False
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "I'm from the UK, do I need a visa to study in Germany?",
+        "Do students from the US need an APS certificate?",
+        "Is the blocked account needed for Dutch students?",
+    ],
+)
+def test_origin_country_does_not_make_a_query_off_topic(query):
+    assert get_query_classifier("cascade").predict(query) is True
+
+
+def test_lower_case_us_is_a_pronoun():
+    assert get_query_classifier("keyword").predict("Can you help us with the enrolment?") is None
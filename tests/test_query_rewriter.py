@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.utils.query_rewriter import QueryRewriter, is_standalone
+
+STANDALONE = [
+    "Can I bring my family with me and how do I register them?",
+    "Is it possible to work while studying in Germany?",
+    "How long does it take to get an appointment at the Ausländerbehörde?",
+    "How much does it cost to study in Germany?",
+    "Do universities accept IELTS if their programme is taught in English?",
+    "Is it necessary to open a blocked account for a student visa?",
+    "Gibt es Stipendien für Studierende aus Indien?",
+    "Wie lange dauert das Visum für Studierende?",
+]
+
+FOLLOW_UPS = [
+    "How much does it cost?",
+    "Is that also true for master's students?",
+    "Do they accept IELTS instead of TestDaF?",
+    "Which of these universities offers English programmes?",
+    "And what about students from Brazil?",
+    "What about Munich?",
+    "Wie viel kostet es?",
+    "Wie lange dauert das ungefähr?",
+]
+
+
+@pytest.mark.parametrize("query", STANDALONE)
+def test_standalone_questions_are_not_rewritten(query):
+    assert is_standalone(query)
+
+
+@pytest.mark.parametrize("query", FOLLOW_UPS)
+def test_references_and_elliptical_starts_are_follow_ups(query):
+    assert not is_standalone(query)
+
+
+class _FailingCompletions:
+    async def create(self, **kwargs):
+        raise AssertionError("a standalone question must not reach the model")
+
+
+class _FailingClient:
+    class chat:
+        completions = _FailingCompletions()
+
+
+def test_standalone_question_skips_the_rewrite_call():
+    rewriter = QueryRewriter(_FailingClient())
+    messages = [
+        {"role": "user", "content": "What documents do I need for a student visa?"},
+        {"role": "assistant", "content": "You need an admission letter and proof of funds."},
+        {"role": "user", "content": STANDALONE[0]},
+    ]
+    assert asyncio.run(rewriter.rewrite(messages)) == STANDALONE[0]
+    assert rewriter.standalone == 1 and rewriter.rewrites == 0
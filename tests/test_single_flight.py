@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from app.utils.single_flight import SingleFlight
+
+
+async def _tokens(count: int, delay: float = 0.005):
+    for i in range(count):
+        yield f"t{i} "
+        await asyncio.sleep(delay)
+
+
+async def _failing():
+    yield "t0 "
+    raise RuntimeError("upstream failed")
+
+
+class _Producer:
+    def __init__(self, answer=lambda: _tokens(5)):
+        self.answer = answer
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return {"answer": self.answer(), "sources": [{"url": "https://example.de"}]}
+
+
+async def _read(answer, limit=None):
+    parts = []
+    async for content in answer:
+        parts.append(content)
+        if limit is not None and len(parts) == limit:
+            break
+    return parts
+
+
+def test_identical_requests_share_one_answer():
+    async def scenario():
+        flights, produce = SingleFlight(), _Producer()
+        leader, follower = await asyncio.gather(flights.run("k", produce), flights.run("k", produce))
+        answers = await asyncio.gather(_read(leader["answer"]), _read(follower["answer"]))
+        return flights, produce, leader, follower, answers
+
+    flights, produce, leader, follower, answers = asyncio.run(scenario())
+    assert produce.calls == 1
+    assert (flights.leaders, flights.coalesced) == (1, 1)
+    assert answers[0] == answers[1] == ["t0 ", "t1 ", "t2 ", "t3 ", "t4 "]
+    assert leader["sources"] == follower["sources"]
+    assert len(flights) == 0
+
+
+def test_follower_keeps_the_answer_when_the_leader_leaves():
+    async def scenario():
+        flights, produce = SingleFlight(), _Producer()
+        leader, follower = await asyncio.gather(flights.run("k", produce), flights.run("k", produce))
+        await _read(leader["answer"], limit=1)
+        await leader["answer"].aclose()
+        return await _read(follower["answer"])
+
+    assert asyncio.run(scenario()) == ["t0 ", "t1 ", "t2 ", "t3 ", "t4 "]
+
+
+def test_request_after_the_last_subscriber_left_starts_a_new_answer():
+    async def scenario():
+        flights, produce = SingleFlight(), _Producer()
+        first = await flights.run("k", produce)
+        await _read(first["answer"], limit=2)
+        await first["answer"].aclose()
+        # Same tick: the cancelled drain task has not unwound yet.
+        second = await flights.run("k", produce)
+        return produce, await _read(second["answer"])
+
+    produce, answer = asyncio.run(scenario())
+    assert produce.calls == 2
+    assert answer == ["t0 ", "t1 ", "t2 ", "t3 ", "t4 "]
+
+
+def test_upstream_error_reaches_every_subscriber():
+    async def scenario():
+        flights, produce = SingleFlight(), _Producer(_failing)
+        results = await asyncio.gather(flights.run("k", produce), flights.run("k", produce))
+        outcomes = []
+        for result in results:
+            with pytest.raises(RuntimeError, match="upstream failed"):
+                await _read(result["answer"])
+            outcomes.append(True)
+        return outcomes
+
+    assert asyncio.run(scenario()) == [True, True]
+
+
+def test_cancelled_leader_lets_waiting_requests_start_over():
+    async def scenario():
+        flights, produce = SingleFlight(), _Producer()
+        leader = asyncio.create_task(flights.run("k", produce))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.run("k", produce))
+        await asyncio.sleep(0)
+        leader.cancel()
+        result = await follower
+        return produce, await _read(result["answer"])
+
+    produce, answer = asyncio.run(scenario())
+    assert produce.calls == 2
+    assert answer == ["t0 ", "t1 ", "t2 ", "t3 ", "t4 "]
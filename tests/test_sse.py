@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+from app.utils.sse import HEARTBEAT, format_event, sse_events
+
+
+async def _answer(parts, delay=0.0, error=None):
+    for part in parts:
+        if delay:
+            await asyncio.sleep(delay)
+        yield part
+    if error is not None:
+        raise error
+
+
+def _collect(answer, **kwargs):
+    async def scenario():
+        return [event async for event in sse_events(answer, [{"url": "https://example.de"}], **kwargs)]
+
+    return asyncio.run(scenario())
+
+
+def _parse(frame):
+    lines = frame.strip().split("\n")
+    assert lines[0].startswith("event: ") and lines[1].startswith("data: ")
+    return lines[0][len("event: "):], json.loads(lines[1][len("data: "):])
+
+
+def test_format_event_frames_json_data():
+    assert format_event("token", {"text": "Grüß"}) == 'event: token\ndata: {"text": "Grüß"}\n\n'
+
+
+def test_stream_starts_with_sources_and_ends_with_done():
+    events = [_parse(frame) for frame in _collect(_answer(["Hello", " world"]), coalesce_interval=0)]
+    assert events[0] == ("sources", [{"url": "https://example.de"}])
+    assert events[-1] == ("done", {})
+    assert "".join(data["text"] for name, data in events if name == "token") == "Hello world"
+    assert {name for name, _ in events} == {"sources", "token", "done"}
+
+
+def test_tokens_within_the_coalesce_interval_are_sent_together():
+    events = [_parse(frame) for frame in _collect(_answer(["a", "b", "c"]), coalesce_interval=10)]
+    tokens = [data["text"] for name, data in events if name == "token"]
+    # The first token goes out at once, the rest are flushed together at the end.
+    assert "".join(tokens) == "abc"
+    assert len(tokens) <= 2
+
+
+def test_upstream_error_is_sent_as_an_error_event_without_done():
+    frames = _collect(_answer(["partial"], error=RuntimeError("boom")), coalesce_interval=0)
+    events = [_parse(frame) for frame in frames]
+    assert events[-1] == ("error", {"error": "boom"})
+    assert ("done", {}) not in events
+    assert ("token", {"text": "partial"}) in events
+
+
+def test_heartbeat_is_sent_while_upstream_is_silent():
+    frames = _collect(_answer(["late"], delay=0.1), heartbeat_interval=0.02, poll_interval=0.01)
+    assert HEARTBEAT in frames
+    assert _parse(frames[-1]) == ("done", {})